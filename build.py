@@ -27,9 +27,8 @@ args = [
     '--onefile',
     '--clean',
     '--collect-all=streamlit',
-    '--collect-all=pandas',
-    '--collect-all=matplotlib',
-    '--collect-all=sklearn',
+    # pandas and matplotlib ship PyInstaller hooks; only matplotlib's fonts and styles need collecting
+    '--collect-data=matplotlib',
     '--hidden-import=streamlit',
     '--hidden-import=dotenv',
     '--hidden-import=Crypto.Cipher.AES',
@@ -37,7 +36,20 @@ args = [
     '--hidden-import=openai',
     '--hidden-import=requests',
     '--hidden-import=matplotlib.pyplot',
-    '--hidden-import=sklearn.preprocessing'
+    # utils/archive.py imports pyarrow inside functions and utils/cube.py reaches it through pandas' feather IO,
+    # so the analysis cannot see it
+    '--hidden-import=pyarrow',
+    '--collect-submodules=pyarrow',
+    # Not used by the app; keep them out even if installed in the build environment
+    '--exclude-module=sklearn',
+    '--exclude-module=scipy',
+    '--exclude-module=tkinter',
+    '--exclude-module=IPython',
+    '--exclude-module=pytest',
+    '--exclude-module=pandas.tests',
+    '--exclude-module=numpy.tests',
+    '--exclude-module=matplotlib.tests',
+    '--exclude-module=pyarrow.tests',
 ]
 
 # On Unix-like systems we can strip the binary to reduce size
@@ -1,28 +1,28 @@
-import json
 import os
 import sys
+import time
+import threading
+from datetime import date
+import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
-import platform
-import subprocess
-
-from utils.analyze_data import (
-    analyze_patterns,
-    get_costs,
-    get_max_cost,
-    get_time_bounds,
-    get_top_counters,
-    get_top_locations,
-)
-from utils.get_eat_record import get_record
-from utils.process_data import process_data
-from utils.prompts import get_eat_habbit_prompt
-from utils.ask_gpt import ask_gpt
-from utils.bonus import get_shower_stats, get_card_stats
+
+from utils.cache import get_cache
+from utils.prompts import get_eat_habbit_batch_prompt
+from utils.records import HIGHLIGHT_TITLES, commentary_records
+from utils.ask_gpt import stream_json
+from utils.merchants import display_name
+from utils.fonts import cjk_fonts
+from utils.charts import calendar_heatmap_spec, merchant_spending_png, merchant_spending_spec
+from utils.cohort import COHORT_MIN_STUDENTS, COHORT_PATH, CohortStats
+from utils.get_eat_record import DEFAULT_END, DEFAULT_START
+from utils.ingest import load_transactions
+from utils.jobs import JobQueueFull, JobService, compute_report, compute_year, report_key
+from utils.periods import compare_years, range_label, year_range
+from utils.tracing import Trace, traced
 
 st.set_page_config(
-    page_title="2025 华子食堂消费总结",
+    page_title="华子食堂消费总结",
     page_icon="🍜",
     layout="wide"
 )
@@ -30,8 +30,13 @@ st.set_page_config(
 # Load environment variables
 load_dotenv()
 
+# CJK fonts are resolved (once, via matplotlib) at the first PNG render, so
+# the default vega backend never imports matplotlib
+
 # Get TEST_MODE from environment variables
 TEST_MODE = os.getenv('TEST_MODE', 'false').lower() == 'true'
+# 示例数据 log.json 为 2024 年的记录
+DEFAULT_RANGE = year_range(2024) if TEST_MODE else (DEFAULT_START, DEFAULT_END)
 
 # 添加自定义 CSS 样式
 def load_css():
@@ -81,60 +86,134 @@ def create_stat_card(title, value, location, date, comment, emoji=""):
         </div>
     """
 
-def plot_merchant_spending(df_raw):
-    # Group by merchant name and sum the transaction amounts
-    merchant_spending = df_raw.groupby('mername')['txamt'].sum().sort_values(ascending=True)
-    
-    # Set Chinese font based on platform
-    system = platform.system()
-    if system == 'Darwin':  # macOS
-        plt.rcParams['font.sans-serif'] = ['Arial Unicode MS']
-    elif system == 'Linux':
-        # Try to install Noto fonts if not present
-        try:
-            subprocess.run(['apt-get', 'update'], check=True)
-            subprocess.run(['apt-get', 'install', '-y', 'fonts-noto-cjk'], check=True)
-        except subprocess.CalledProcessError:
-            st.warning("无法安装字体，可能需要管理员权限。图表中文显示可能不正常。")
-        except FileNotFoundError:
-            st.warning("未找到apt-get命令，请手动安装fonts-noto-cjk包。")
-        
-        plt.rcParams['font.sans-serif'] = ['Noto Sans CJK JP', 'Noto Sans CJK SC', 'Noto Sans CJK TC', 'DengXian', 'SimHei', 'SimSun', 'WenQuanYi Micro Hei', 'FangSong_GB2312', 'KaiTi_GB2312']
-    else:  # Windows
-        plt.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'DengXian', 'SimSun', 'SimHei', 'KaiTi', 'FangSong']
-    plt.rcParams['axes.unicode_minus'] = False
-
-    # Create high-resolution figure
-    plt.figure(figsize=(12, len(merchant_spending) / 66 * 18), dpi=500)
-    
-    # Set higher quality settings
-    plt.rcParams['figure.dpi'] = 500
-    plt.rcParams['savefig.dpi'] = 500
-    plt.rcParams['figure.figsize'] = [12, len(merchant_spending) / 66 * 18]
-    plt.rcParams['figure.autolayout'] = True
-    
-    # Create horizontal bar plot
-    plt.barh(range(len(merchant_spending)), merchant_spending)
-    
-    # Add value labels on the bars with adjusted font size for high DPI
-    for i, value in enumerate(merchant_spending):
-        plt.text(value + 0.01 * max(merchant_spending), i, 
-                f'¥{value:.2f}', va='center', ha='left', fontsize=6)
-    
-    # Customize the plot with adjusted font sizes
-    plt.yticks(range(len(merchant_spending)), merchant_spending.index, fontsize=8)
-    plt.xlabel('消费金额（元）', fontsize=10)
-    plt.title('各窗口消费总额', fontsize=12)
-    plt.xlim(0, 1.2 * max(merchant_spending))
-    
-    # Adjust layout to prevent label cutoff
-    plt.tight_layout()
-    
-    return plt.gcf()
+# 报告由所有会话共享的有界工作池生成：同一学号、Cookie 与时间范围的请求合并为一个任务，
+# 任务在一小时内的结果直接复用；排队已满时提示稍后再试，而不是让所有人一起变慢。
+# 前端只提交任务并轮询状态，重跑（如修改侧边栏）会接上仍在进行的任务。
+# 评论阶段由 ask_gpt 的内容寻址缓存负责，历年对比按自然年分别提交任务。
+_stage_misses = threading.local()
+# 轮询任务状态的间隔（秒）
+POLL_INTERVAL = 0.3
+# TEST_MODE 下所有任务读取示例数据
+SOURCE = "log.json" if TEST_MODE else None
+
+def _record_miss(stage):
+    _stage_misses.stages.add(stage)
+
+@st.cache_resource
+def get_jobs():
+    return JobService()
+
+def wait_for(job, status):
+    # 排队时显示前面还有几份报告，运行时显示已用时间
+    while not job.done():
+        if job.state == 'queued':
+            status.info(f"⏳ 排队中，前面还有 {get_jobs().position(job)} 份报告在排队")
+        else:
+            status.info(f"⚙️ 正在生成，已用时 {time.time() - job.submitted_at:.0f} 秒")
+        time.sleep(POLL_INTERVAL)
+    status.empty()
+    return job.result()
+
+def submit(stage, key, fn, *args):
+    job, created = get_jobs().submit(key, fn, *args)
+    if created:
+        _record_miss(stage)
+    return job
+
+@traced('stage.report')
+def metrics_stage(idserial, servicehall, start, end, status):
+    return wait_for(submit('report', report_key(idserial, servicehall, start, end), compute_report,
+                           idserial, servicehall, start, end, SOURCE), status)
+
+@traced('stage.years')
+def year_stages(idserial, servicehall, years, status):
+    # 先提交所有年份，各年在工作池中并行计算；各年结果只在 REPORT_RESULT_TTL 内复用，
+    # 过期后从本地记录缓存重新汇总，不再请求已覆盖的年份
+    jobs = {year: submit('years', report_key(idserial, servicehall, year), compute_year,
+                         idserial, servicehall, year, SOURCE) for year in years}
+    return {year: wait_for(job, status) for year, job in jobs.items()}
+
+@st.cache_data(show_spinner=False, max_entries=32)
+@traced('stage.figures')
+def figure_stage(spending, backend):
+    # Keyed by the hash of the aggregated series, so reports with identical
+    # aggregates share one render
+    _record_miss('figures')
+    if backend == 'vega':
+        return merchant_spending_spec(spending)
+    if not cjk_fonts():
+        st.warning("未找到可用的中文字体，图表中文显示可能不正常。请安装 fonts-noto-cjk 等中文字体，或改用交互式图表。")
+    return merchant_spending_png(spending)
+
+# 同学排名卡片: (指标, 标题, 说明, 数值越小越靠前)
+COHORT_CARDS = [
+    ('total_cost', "💰 总消费", "花得比这么多同学多", False),
+    ('avg_cost', "🍱 平均每顿", "每顿比这么多同学吃得贵", False),
+    ('meals', "🍚 吃饭顿数", "比这么多同学吃得勤", False),
+    ('most_expensive', "🤑 最贵一餐", "比这么多同学更舍得", False),
+    ('earliest', "☀️ 最早一餐", "比这么多同学起得早", True),
+    ('latest', "🌙 最晚一餐", "比这么多同学睡得晚", False),
+    ('showers', "🛁 洗澡次数", "比这么多同学洗得勤", False),
+]
+COHORT_COLUMNS = 4
+
+@st.cache_data(show_spinner=False)
+def source_years(source):
+    return sorted(load_transactions(source)['txdate'].dt.year.unique().tolist())
+
+def comparable_years():
+    # 历年对比只提供可能有记录的年份：从默认范围与该同学最早一条缓存记录中较早的一年起，
+    # 到今年为止，去掉已完整查询过却没有记录的年份；示例数据只有其中出现的年份
+    first, last = DEFAULT_RANGE[0].year, max(DEFAULT_RANGE[1].year, date.today().year)
+    if 'report_key' not in st.session_state:
+        return list(range(first, last + 1))
+    if SOURCE is not None:
+        return source_years(SOURCE)
+    idserial, servicehall = st.session_state['report_key']
+    return get_cache().years(servicehall, idserial, first, last)
+
+@st.cache_resource(ttl=3600)
+def get_cohort():
+    # 没有排名数据或人数太少时不显示排名
+    cohort = CohortStats.load(COHORT_PATH)
+    return cohort if cohort is not None and cohort.students >= COHORT_MIN_STUDENTS else None
+
+YEAR_COLUMNS = {
+    'meals': '顿数', 'total_cost': '总消费（元）', 'avg_cost': '平均每顿（元）', 'top_location': '主力食堂',
+    'top_counter': '心头好窗口', 'earliest': '最早一餐', 'latest': '最晚一餐', 'most_expensive': '最贵一餐（元）',
+    'showers': '洗澡次数', 'total_change': '总消费同比',
+}
+
+def show_stage_report(with_years=False, job_stages=None):
+    # job_stages: 报告任务内部各阶段（读取解析记录、合并用餐）是否命中任务内的缓存
+    stages = ['report', 'figures'] + (['years'] if with_years else [])
+    with st.sidebar.expander("🛠️ 缓存命中情况", expanded=False):
+        for stage in stages:
+            hit = stage not in _stage_misses.stages
+            lines = [f"- `{stage}`: {'✅ 命中缓存' if hit else '🔄 重新计算'}"]
+            if stage == 'report' and not hit and job_stages:
+                lines += [f"    - `{name}`: {'✅ 命中缓存' if state == 'hit' else '🔄 重新计算'}"
+                          for name, state in job_stages.items()]
+            st.markdown("\n".join(lines))
+        stats = get_jobs().stats
+        st.caption("任务：新建 {submitted}，合并 {deduplicated}，拒绝 {rejected}，失败 {failed}".format(**stats))
+
+def show_trace(trace):
+    # 只显示本次重跑中实际执行的部分，命中缓存的阶段不会出现
+    with st.expander("🐞 性能分析", expanded=True):
+        records = trace.records()
+        if not records:
+            st.caption("本次重跑全部命中缓存")
+            return
+        st.caption(f"本次重跑共 {trace.elapsed * 1e3:.0f} ms")
+        table = pd.DataFrame(records)
+        table['name'] = ['\u3000' * depth + name for depth, name in zip(table.pop('depth'), table['name'])]
+        st.dataframe(table.set_index('name'))
+        st.bar_chart(pd.Series(trace.totals(), name='ms'), horizontal=True)
 
 def main():
+    _stage_misses.stages = set()
     load_css()
-    st.title("🍜 2025 华子食堂消费总结")
     
     # Sidebar for configuration
     with st.sidebar:
@@ -142,12 +221,27 @@ def main():
         base_url = st.text_input("Base URL", value=os.getenv("BASE_URL", "https://api.deepseek.com"))
         model = st.text_input("Model", value=os.getenv("MODEL", "deepseek-chat"))
         api_key = st.text_input("API Key", value=os.getenv("API_KEY", ""), type="password")
+        st.header("📈 图表设置")
+        chart_backend = st.radio(
+            "图表样式", ["vega", "png"],
+            format_func=lambda backend: "交互式（矢量）" if backend == 'vega' else "高清图片（PNG）"
+        )
+        st.header("📅 时间范围")
+        report_range = st.date_input("报告时间范围", value=DEFAULT_RANGE)
+        # 只选了起始日期时按单日处理
+        dates = tuple(report_range) if isinstance(report_range, (tuple, list)) else (report_range,)
+        start, end = dates[0], dates[-1]
+        compared = st.multiselect("历年对比", comparable_years()[::-1], key='compared_years',
+                                  help="按自然年汇总，可与报告范围同时查看")
+        st.checkbox("🐞 性能分析面板", key='debug_panel', help="记录本次重跑中各阶段的耗时")
+    label = range_label(start, end)
+    st.title(f"🍜 {label} 华子食堂消费总结")
     
     # 更新欢迎页面文案
     st.markdown("""
     
-    👋 这是一个专门为华子吃货们打造的 2025 年度美食档案！
-    """)
+    👋 这是一个专门为华子吃货们打造的 {label} 美食档案！
+    """.format(label=label))
 
     # 更新用户输入区域文案
     with st.form("user_input"):
@@ -167,20 +261,32 @@ def main():
                 st.error("⚠️ 请填写完整信息！")
                 return
 
-            # First spinner for data fetching
-            with st.spinner("正在获取数据，请稍候..."):
-                try:
-                    data = get_record(servicehall, idserial) if not TEST_MODE else json.load(open("log.json", "r", encoding='utf-8'))
-                    df_raw, df = process_data(data)
-                    username = df['username'].iloc[0]
-                    shower_stats = get_shower_stats(data)
-                    card_stats = get_card_stats(data)
-                    st.success("✅ 数据获取成功")
-                except Exception as e:
-                    st.error(f"❌ 数据获取失败，请检查学号和 Cookie 是否正确，并确认 Cookies 是在本电脑上获取的（而不是来自其他同学的设备）")
-                    return
+            # 记住本次提交，之后修改侧边栏等触发的重跑直接复用缓存的阶段
+            st.session_state['report_key'] = (idserial, servicehall)
+
+        if 'report_key' not in st.session_state:
+            return
+        idserial, servicehall = st.session_state['report_key']
 
-    if submitted:
+        # First spinner for data fetching
+        with st.spinner("正在获取数据，请稍候..."):
+            try:
+                metrics = metrics_stage(idserial, servicehall, start, end, st.empty())
+                username = metrics['username']
+                shower_stats = metrics['shower_stats']
+                card_stats = metrics['card_stats']
+                st.success("✅ 数据获取成功")
+                if not TEST_MODE and 'report' in _stage_misses.stages:
+                    st.caption("本地缓存命中率: {:.0%}".format(get_cache().hit_rate()))
+            except JobQueueFull:
+                st.warning("🚦 当前使用人数较多，服务器繁忙，请稍后再试")
+                return
+            except Exception as e:
+                # 失败的任务不会被复用，重新提交即可重试
+                st.error(f"❌ 数据获取失败，请检查学号和 Cookie 是否正确，并确认 Cookies 是在本电脑上获取的（而不是来自其他同学的设备）")
+                return
+
+    if 'report_key' in st.session_state:
         # Create expander after successful data fetch
         with st.expander(f"📊 {username}的美食探险日记", expanded=True):
             # Second spinner for report generation
@@ -190,16 +296,16 @@ def main():
                     st.subheader("💰 年度资金报告")
                     col1, col2 = st.columns(2)
                     
-                    avg_cost, total_cost = get_costs(df)
+                    avg_cost, total_cost = metrics['costs']
                     with col1:
                         cups = int(total_cost // 13)
                         st.markdown("""
                             <div class='stat-card card-blue'>
-                                <div class='stat-label'>2025 一共吃了</div>
+                                <div class='stat-label'>{label} 一共吃了</div>
                                 <div class='stat-value'>¥{total_cost:.2f}</div>
                                 <div class='stat-label'>相当于 {cups} 杯生椰拿铁 🥥</div>
                             </div>
-                        """.format(total_cost=total_cost, cups=cups), unsafe_allow_html=True)
+                        """.format(label=label, total_cost=total_cost, cups=cups), unsafe_allow_html=True)
                     
                     with col2:
                         cups = float(round(avg_cost / 13, 1))
@@ -213,7 +319,7 @@ def main():
 
                     # 2. 最常光顾食堂展示
                     st.subheader("🏆 你的主力探店地")
-                    top_3_canteens = get_top_locations(df)
+                    top_3_canteens = metrics['top_locations']
                     cols = st.columns(3)  # 创建3列
                     
                     for idx, ((location, visits), col) in enumerate(zip(top_3_canteens.items(), cols), 1):
@@ -230,7 +336,7 @@ def main():
 
                     # 3. 最喜爱的窗口
                     st.subheader("🎯 你的心头好")
-                    counter_visits = get_top_counters(df)
+                    counter_visits = metrics['top_counters']
                     top_5_counters = counter_visits.head()
                     cols = st.columns(5)
                     
@@ -239,7 +345,7 @@ def main():
                             st.markdown(f"""
                                 <div class='stat-card'>
                                     <div class='stat-label'>第 {idx} 名</div>
-                                    <div class='stat-value'>{counter.replace('园_', '')}</div>
+                                    <div class='stat-value'>{display_name(counter)}</div>
                                     <div class='stat-label'>吃了 {visits} 次</div>
                                 </div>
                             """, unsafe_allow_html=True)
@@ -247,69 +353,37 @@ def main():
 
                     # 4. 最逆天的记录
                     st.subheader("🤡 最逆天的一餐")
-                    earliest, latest = get_time_bounds(df)
-                    most_expensive = get_max_cost(df)
+                    earliest, latest = metrics['earliest'], metrics['latest']
+                    most_expensive = metrics['most_expensive']
                     
-                    earliest_prompt = get_eat_habbit_prompt(username, earliest)
-                    latest_prompt = get_eat_habbit_prompt(username, latest)
-                    most_expensive_prompt = get_eat_habbit_prompt(username, most_expensive)
-                    
-                    try:
-                        earliest_comment = ask_gpt(earliest_prompt, model=model, api_key=api_key, base_url=base_url)
-                        latest_comment = ask_gpt(latest_prompt, model=model, api_key=api_key, base_url=base_url)
-                        most_expensive_comment = ask_gpt(most_expensive_prompt, model=model, api_key=api_key, base_url=base_url)
-                    except Exception as e:
-                        st.error(
-                            "❌ 调用 AI 失败，请检查侧边栏的设置并重试，这可能是由于以下原因之一：\n\n"
-                            "1. API Key 不正确或已过期（一般为 `sk-*****` 的形式）\n"
-                            "2. Base URL 配置错误（一般为 `https://api.deepseek.com` 的形式）\n"
-                            "3. 模型名称错误或不可用（一般为 `deepseek-chat` 的形式）\n\n"
-                            f"错误信息: {str(e)}"
-                        )
-                        earliest_comment = "无法生成评论"
-                        latest_comment = "无法生成评论"
-                        most_expensive_comment = "无法生成评论"
+                    # 每张卡片: (标题, 数值, 记录, 日期格式, emoji)
+                    highlights = {
+                        'earliest': (HIGHLIGHT_TITLES['earliest'], earliest['txdate'].strftime('%H:%M'), earliest,
+                                     '%Y-%m-%d', "☀️"),
+                        'latest': (HIGHLIGHT_TITLES['latest'], latest['txdate'].strftime('%H:%M'), latest,
+                                   '%Y-%m-%d', "🌙"),
+                        'most_expensive': (HIGHLIGHT_TITLES['most_expensive'], f"¥{most_expensive['txamt']:.2f}",
+                                           most_expensive, '%Y-%m-%d %H:%M', "💫"),
+                    }
+                    comments = {key: "" for key in highlights}
+                    placeholders = dict(zip(highlights, (col.empty() for col in st.columns(len(highlights)))))
 
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        st.markdown(
+                    def render_highlight(key):
+                        title, value, record, date_format, emoji = highlights[key]
+                        placeholders[key].markdown(
                             create_stat_card(
-                                "清晨觅食冠军", 
-                                earliest['txdate'].strftime('%H:%M'),
-                                earliest['meraddr'],
-                                earliest['txdate'].strftime('%Y-%m-%d'),
-                                earliest_comment,
-                                "☀️"
-                            ),
-                            unsafe_allow_html=True
-                        )
-                    
-                    with col2:
-                        st.markdown(
-                            create_stat_card(
-                                "夜宵王者",
-                                latest['txdate'].strftime('%H:%M'),
-                                latest['meraddr'],
-                                latest['txdate'].strftime('%Y-%m-%d'),
-                                latest_comment,
-                                "🌙"
+                                title,
+                                value,
+                                record['meraddr'],
+                                record['txdate'].strftime(date_format),
+                                comments[key],
+                                emoji
                             ),
                             unsafe_allow_html=True
                         )
 
-                    with col3:
-                        st.markdown(
-                            create_stat_card(
-                                "土豪餐王",
-                                f"¥{most_expensive['txamt']:.2f}",
-                                most_expensive['meraddr'],
-                                most_expensive['txdate'].strftime('%Y-%m-%d %H:%M'),
-                                most_expensive_comment,
-                                "💫"
-                            ),
-                            unsafe_allow_html=True
-                        )
+                    for key in highlights:
+                        render_highlight(key)
                     st.markdown("", unsafe_allow_html=True)
 
                     # 4.5 Bonus 区域：洗澡/补卡，保持与逆天卡片相似的风格
@@ -317,13 +391,17 @@ def main():
                         col1, col2 = st.columns(2)
 
                         with col1:
-                            st.markdown(
+                            shower_placeholder = st.empty()
+
+                        def render_shower():
+                            shower_placeholder.markdown(
                                 """
                                 <div class='stat-card'>
                                     <div class='stat-label'>洗澡大王 🛁</div>
                                     <div class='stat-value'>总金额: ¥{amount:.2f}</div>
                                     <div class='stat-label'>共计洗澡 {count} 次，平均每次 ¥{avg_amount:.2f}</div>
                                     <div class='stat-label'>按水价为 ¥0.04 /磅计算，折合共计用开水 {weight_lb:.2f} 磅，每次洗澡用开水 {avg_weight_lb:.2f} 磅</div>
+                                    <div class='stat-label'>{comment}</div>
                                 </div>
                                 """.format(
                                     count=shower_stats.get("count", 0),
@@ -331,10 +409,13 @@ def main():
                                     avg_amount=shower_stats.get("avg_amount", 0.0),
                                     weight_lb=shower_stats.get("weight_lb", 0.0),
                                     avg_weight_lb=shower_stats.get("avg_weight_lb", 0.0),
+                                    comment=comments.get('shower', ""),
                                 ),
                                 unsafe_allow_html=True,
                             )
 
+                        render_shower()
+
                         with col2:
                             st.markdown(
                                 """
@@ -352,15 +433,89 @@ def main():
                                 unsafe_allow_html=True,
                             )
 
+                    # 逐字渲染：所有卡片的评论在一次请求中以 JSON 生成，说明与示例只发送一次；
+                    # 收到一段就刷新对应卡片
+                    # 每条记录压缩为一行（时间、地点、窗口、金额、餐次），同样的记录总得到同样的提示词；
+                    # 每张卡片本就是其标题所说的第一名，不再附排名
+                    records = commentary_records(metrics)
+                    renderers = {**{key: (lambda key=key: render_highlight(key)) for key in highlights},
+                                 'shower': render_shower}
+                    try:
+                        prompt = get_eat_habbit_batch_prompt(username, records)
+                        for key, text in stream_json(prompt, list(records), model=model, api_key=api_key,
+                                                     base_url=base_url):
+                            comments[key] = text
+                            renderers[key]()
+                    except Exception as e:
+                        st.error(
+                            "❌ 调用 AI 失败，请检查侧边栏的设置并重试，这可能是由于以下原因之一：\n\n"
+                            "1. API Key 不正确或已过期（一般为 `sk-*****` 的形式）\n"
+                            "2. Base URL 配置错误（一般为 `https://api.deepseek.com` 的形式）\n"
+                            "3. 模型名称错误或不可用（一般为 `deepseek-chat` 的形式）\n\n"
+                            f"错误信息: {str(e)}"
+                        )
+                        for key in records:
+                            comments[key] = "无法生成评论"
+                            renderers[key]()
+
+                    # 4.6 同学排名：只读取预先构建的分位数草图，不需要其他同学的数据；
+                    # 草图按固定时间范围构建，只有报告范围与之一致时排名才有意义
+                    cohort = get_cohort()
+                    if cohort is not None and not cohort.covers(start, end):
+                        st.caption(f"💡 报告时间范围选择 {range_label(cohort.start, cohort.end)} 时可查看你在同学中的排名")
+                    elif cohort is not None:
+                        st.subheader("🏅 你在同学中的位置")
+                        values = metrics['cohort']
+                        cols = [col for row in range(0, len(COHORT_CARDS), COHORT_COLUMNS)
+                                for col in st.columns(COHORT_COLUMNS)][:len(COHORT_CARDS)]
+                        for (metric, title, template, lower_wins), col in zip(COHORT_CARDS, cols):
+                            share = (cohort.above if lower_wins else cohort.below)(metric, values[metric])
+                            with col:
+                                st.markdown(f"""
+                                    <div class='stat-card'>
+                                        <div class='stat-label'>{title}</div>
+                                        <div class='stat-value'>{share:.0%}</div>
+                                        <div class='stat-label'>{template}</div>
+                                    </div>
+                                """, unsafe_allow_html=True)
+                        st.caption(f"基于 {cohort.students} 位同学的统计，为近似值")
+
                     # Add this section where you want to display the plot
                     st.subheader("💰 细细细则")
-                    fig = plot_merchant_spending(df_raw)
-                    st.pyplot(fig)
-                    plt.close()
+                    chart = figure_stage(metrics['spending'], chart_backend)
+                    if chart_backend == 'vega':
+                        st.vega_lite_chart(chart)
+                    else:
+                        st.image(chart)
+
+                    # 4.7 消费日历与各食堂月度消费：均由任务中预先聚合的数据立方体切片得到
+                    st.subheader("📆 消费日历")
+                    cube = metrics['cube']
+                    st.vega_lite_chart(calendar_heatmap_spec(cube.calendar(start, end)))
+                    by_month = cube.matrix('month')
+                    by_month.index = by_month.index.strftime('%Y-%m')
+                    st.dataframe(by_month.rename_axis('月份').round(2))
+
+                    # 5. 历年对比：各年分别提交任务，加选年份只计算新增的年份
+                    if compared:
+                        st.subheader("📅 历年对比")
+                        table = compare_years(year_stages(idserial, servicehall, compared, st.empty()))
+                        st.dataframe(table.rename(columns=YEAR_COLUMNS).rename_axis('年份'))
+                        st.bar_chart(table['total_cost'].rename('总消费（元）'))
 
+                except JobQueueFull:
+                    st.warning("🚦 当前使用人数较多，历年对比暂时无法生成，请稍后再试")
                 except Exception as e:
                     st.error(f"❌ 生成报告时出现错误: {str(e)}")
                     return
+                finally:
+                    show_stage_report(with_years=bool(compared), job_stages=metrics.get('stages'))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 勾选后才创建 Trace；未勾选时各处的 span 都是空操作
+    if st.session_state.get('debug_panel'):
+        with Trace('report') as trace:
+            main()
+        show_trace(trace)
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.archive import export_transactions, load_archive
+from utils.ingest import load_transactions
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log.json')
+
+
+def payload(rows):
+    return {"message": "成功", "resultData": {"totalpage": 1, "rows": rows}}
+
+
+def round_trip(source, tmp_path):
+    path = tmp_path / 'records.arrow'
+    export_transactions(source, path)
+    return load_archive(path)
+
+
+def test_log_json_round_trip(tmp_path):
+    expected = load_transactions(LOG_PATH)
+    pd.testing.assert_frame_equal(round_trip(LOG_PATH, tmp_path), expected, check_dtype=False,
+                                  check_categorical=False)
+
+
+def test_missing_username_stays_missing(tmp_path):
+    rows = [
+        {'txdate': '2025-03-01 12:00:00', 'txamt': 850, 'summary': '持卡人消费', 'meraddr': '紫荆园',
+         'mername': '紫荆园_二层大伙', 'username': '测试'},
+        {'txdate': '2025-03-01 18:00:00', 'txamt': 600, 'summary': '持卡人消费', 'meraddr': '桃李园',
+         'mername': '桃李园_一层'},
+    ]
+    table = round_trip(payload(rows), tmp_path)
+    assert table['username'].iloc[0] == '测试'
+    assert pd.isna(table['username'].iloc[1])
+    assert 'None' not in table['username'].tolist()
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import ask_gpt as llm
+from utils.ask_gpt import CLIENT_CACHE_SIZE, ask_gpt, get_client, prompt_key, stream_json
+from utils.prompts import get_eat_habbit_batch_prompt
+from utils.stub_server import StubLLMServer
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm, 'LLM_CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture(scope='module')
+def server():
+    with StubLLMServer(token_latency=0.0) as server:
+        yield server
+
+
+def ask(server, prompt, **kwargs):
+    return ask_gpt(prompt, 'stub', 'stub-key', server.base_url, **kwargs)
+
+
+def test_reply_is_cached_by_prompt(server):
+    before = server.requests
+    assert ask(server, "缓存测试") == server.reply
+    assert ask(server, "缓存测试") == server.reply
+    assert server.requests == before + 1
+    # A different prompt is a different entry
+    ask(server, "缓存测试 2")
+    assert server.requests == before + 2
+
+
+def test_cache_false_always_asks(server):
+    before = server.requests
+    ask(server, "不缓存", cache=False)
+    ask(server, "不缓存", cache=False)
+    assert server.requests == before + 2
+
+
+def test_stream_is_cached_whole(server):
+    before = server.requests
+    assert ''.join(ask(server, "流式", stream=True)) == server.reply
+    # The cached reply comes back as a single delta
+    assert list(ask(server, "流式", stream=True)) == [server.reply]
+    assert server.requests == before + 1
+
+
+def test_stream_json_yields_every_card_then_caches(server):
+    records = {'earliest': ("清晨觅食冠军", "时间 2024-03-01 06:49"), 'shower': ("洗澡大王", "共计洗澡 3 次")}
+    prompt, keys = get_eat_habbit_batch_prompt('测试', records), list(records)
+    before = server.requests
+    final = dict(stream_json(prompt, keys, 'stub', 'stub-key', server.base_url))
+    assert final == {key: server.reply for key in keys}
+    # A cached reply yields each card once, in the order asked
+    assert list(stream_json(prompt, keys, 'stub', 'stub-key', server.base_url)) == list(final.items())
+    assert server.requests == before + 1
+
+
+def test_cache_outlives_the_client(server):
+    ask(server, "换客户端")
+    get_client.cache_clear()
+    before = server.requests
+    assert ask(server, "换客户端") == server.reply
+    assert server.requests == before
+
+
+def test_prompt_key_normalizes_line_endings_and_composition():
+    assert prompt_key('m', "早餐\r\n午餐") == prompt_key('m', "早餐\n午餐")
+    assert prompt_key('m', "cafe\u0301") == prompt_key('m', "caf\u00e9")
+    assert prompt_key('m', "早餐") != prompt_key('n', "早餐")
+
+
+def test_client_is_shared_per_key_and_endpoint(server):
+    get_client.cache_clear()
+    client = get_client('key-a', server.base_url)
+    assert get_client('key-a', server.base_url) is client
+    assert get_client('key-b', server.base_url) is not client
+
+
+def test_client_cache_is_bounded(server):
+    get_client.cache_clear()
+    first = get_client('key-0', server.base_url)
+    for i in range(1, CLIENT_CACHE_SIZE + 1):
+        get_client(f'key-{i}', server.base_url)
+    assert get_client.cache_info().currsize == CLIENT_CACHE_SIZE
+    # The least recently used key was dropped
+    assert get_client('key-0', server.base_url) is not first
@@ -0,0 +1,33 @@
+import os
+import sys
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.cache import RecordCache
+
+
+def fake_fetch(rows):
+    def fetch(servicehall, idserial, start, end):
+        found = [row for row in rows if start.isoformat() <= row['txdate'][:10] <= end.isoformat()]
+        return {"resultData": {"rows": found}}
+    return fetch
+
+
+ROWS = [
+    {'txdate': '2023-11-02 12:00:00', 'txamt': 900, 'summary': '持卡人消费', 'meraddr': '紫荆园', 'mername': '紫荆园_一层'},
+    {'txdate': '2021-05-06 08:00:00', 'txamt': 300, 'summary': '持卡人消费', 'meraddr': '桃李园', 'mername': '桃李园_一层'},
+]
+
+
+def test_years_before_any_fetch_is_the_given_range(tmp_path):
+    cache = RecordCache(str(tmp_path / 'records.sqlite3'), fetch=fake_fetch(ROWS))
+    assert cache.years('cookie', 'id', 2024, 2026) == [2024, 2025, 2026]
+
+
+def test_years_start_at_earliest_record_and_skip_empty_covered_years(tmp_path):
+    cache = RecordCache(str(tmp_path / 'records.sqlite3'), fetch=fake_fetch(ROWS))
+    cache.get_record('cookie', 'id', date(2020, 1, 1), date(2024, 12, 31))
+    # 2020, 2022 and 2024 were fetched in full and are empty; 2025 is outside the cached range
+    assert cache.years('cookie', 'id', 2024, 2025) == [2021, 2023, 2025]
+    # Another student's cache says nothing about this one
+    assert cache.years('other-cookie', 'id', 2024, 2025) == [2024, 2025]
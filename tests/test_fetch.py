@@ -0,0 +1,76 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import get_eat_record as card
+from utils.get_eat_record import fetch_page, get_record, split_windows
+from utils.stub_server import StubCardServer
+from utils.synthetic import generate_rows
+
+START = date(2025, 1, 1)
+
+
+@pytest.fixture(scope='module')
+def rows():
+    # About 500 days, newest first as the API returns them
+    return generate_rows(2000, START, seed=1)
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    # Several pages per window, so pagination is exercised as well as window splitting
+    monkeypatch.setattr(card, 'PAGE_SIZE', 100)
+
+
+def in_range(rows, start, end):
+    return [row for row in rows if start.isoformat() <= row['txdate'][:10] <= end.isoformat()]
+
+
+def test_split_windows_cover_range_without_overlap():
+    start, end = date(2024, 2, 29), date(2025, 3, 1)
+    windows = split_windows(start, end)
+    assert windows[0][0] == start and windows[-1][1] == end
+    for (_, stop), (begin, _) in zip(windows, windows[1:]):
+        assert begin == stop + timedelta(days=1)
+    assert all((stop - begin).days < card.WINDOW_DAYS for begin, stop in windows)
+    assert split_windows(end, start) == []
+
+
+def test_full_range_matches_generator(rows, small_pages):
+    last = date.fromisoformat(rows[0]['txdate'][:10])
+    with StubCardServer(rows) as server:
+        payload = get_record('cookie', 'id', START, last, base_url=server.base_url)
+        requests = server.requests
+    fetched = payload['resultData']['rows']
+    assert len(fetched) == len(rows) == payload['resultData']['total']
+    # Windows are merged newest first, so the result is in the generator's (and the API's) order
+    assert fetched == rows
+    windows = split_windows(START, last)
+    assert requests >= len(windows) and requests > len(rows) // card.PAGE_SIZE
+
+
+def test_partial_range_across_window_boundaries(rows, small_pages):
+    start, end = START + timedelta(days=50), START + timedelta(days=300)
+    with StubCardServer(rows) as server:
+        fetched = get_record('cookie', 'id', start, end, base_url=server.base_url)['resultData']['rows']
+    assert fetched == in_range(rows, start, end)
+
+
+def test_merged_output_matches_direct_fetch(rows, monkeypatch):
+    start, end = START, START + timedelta(days=200)
+    with StubCardServer(rows) as server:
+        # One page over the whole range, as a single unsplit request would return it
+        monkeypatch.setattr(card, 'PAGE_SIZE', len(rows))
+        direct = fetch_page('cookie', 'id', start, end, 0, server.base_url)['resultData']['rows']
+        monkeypatch.setattr(card, 'PAGE_SIZE', 100)
+        merged = get_record('cookie', 'id', start, end, base_url=server.base_url)['resultData']['rows']
+    assert merged == direct
+
+
+def test_empty_range(rows, small_pages):
+    with StubCardServer(rows) as server:
+        payload = get_record('cookie', 'id', date(2020, 1, 1), date(2020, 12, 31), base_url=server.base_url)
+    assert payload['resultData']['rows'] == []
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analyze_data import analyze_patterns, get_costs, get_max_cost, get_time_bounds, get_top_counters, \
+    get_top_locations
+from utils.incremental import IncrementalReport
+from utils.process_data import process_data
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log.json')
+
+
+@pytest.fixture(scope='module')
+def frames():
+    return process_data(LOG_PATH)
+
+
+def meal(record):
+    return record['txdate'], record['meraddr'], record['txamt']
+
+
+def assert_matches_batch(report, df):
+    # Same results as the batch functions on the whole frame, up to float rounding in the running sums
+    np.testing.assert_allclose(report.get_costs(), get_costs(df), rtol=1e-9)
+    assert list(report.get_top_locations().items()) == list(get_top_locations(df).items())
+    assert list(report.get_top_counters().items()) == list(get_top_counters(df).items())
+    mine = (*report.get_time_bounds(), report.get_max_cost())
+    assert [meal(m) for m in mine] == [meal(m) for m in (*get_time_bounds(df), get_max_cost(df))]
+    monthly = report.monthly_stats()
+    for month, stats in analyze_patterns(df, plot=False).items():
+        np.testing.assert_allclose([monthly[month]['std'], monthly[month]['score']], [stats['std'], stats['score']],
+                                   rtol=1e-9, atol=1e-9)
+        assert monthly[month]['meals'].to_dict() == stats['meals'].to_dict()
+
+
+def fold(parts):
+    report = IncrementalReport()
+    for part in parts:
+        report.update(part)
+    return report
+
+
+@pytest.mark.parametrize('batches', [1, 3, 17, 200])
+def test_batches_match_batch_functions(frames, batches):
+    rows, merged = frames
+    bounds = np.linspace(0, len(rows), batches + 1).astype(int)
+    assert_matches_batch(fold(rows.iloc[i:j] for i, j in zip(bounds[:-1], bounds[1:])), merged)
+
+
+def test_meal_split_across_batches_is_merged(frames):
+    rows, merged = frames
+    # Cut inside every multi-row meal, so each of them straddles two batches
+    cuts = np.cumsum(merged['mername'].map(len).to_numpy())
+    inside = [cut - 1 for cut, size in zip(cuts, merged['mername'].map(len)) if size > 1]
+    assert inside
+    bounds = [0, *inside, len(rows)]
+    report = fold(rows.iloc[i:j] for i, j in zip(bounds[:-1], bounds[1:]))
+    assert report._current().meals == len(merged)
+    assert_matches_batch(report, merged)
+
+
+def test_open_meal_counts_until_the_next_one_starts():
+    rows = pd.DataFrame({
+        'txdate': pd.to_datetime(['2024-03-01 12:00', '2024-03-01 12:10', '2024-03-01 18:00']),
+        'txamt': [10.0, 2.5, 8.0],
+        'meraddr': ['紫荆园', '紫荆园', '桃李园'],
+        'mername': ['紫荆园_米饭', '紫荆园_汤', '桃李园_面条'],
+        'username': ['测试'] * 3,
+    })
+    report = IncrementalReport().update(rows.iloc[:1])
+    assert report.get_costs()[1] == 10.0
+    report.update(rows.iloc[1:2])
+    assert report.get_costs()[1] == 12.5 and report.get_max_cost()['txamt'] == 12.5
+    report.update(rows.iloc[2:])
+    assert report.get_costs()[1] == 20.5
+    assert report.get_top_counters().to_dict() == {'桃李园_面条': 1, '紫荆园_汤': 1, '紫荆园_米饭': 1}
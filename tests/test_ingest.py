@@ -0,0 +1,77 @@
+import io
+import os
+import sys
+import json
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.ingest import MEAL_SUMMARIES, iter_json_rows, load_transactions, load_transactions_stream
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log.json')
+
+
+def payload(rows):
+    return {"message": "成功", "resultData": {"totalpage": 1, "rows": rows}}
+
+
+def row(**fields):
+    base = {'txdate': '2025-03-01 12:00:00', 'txamt': 850, 'summary': '持卡人消费', 'meraddr': '紫荆园',
+            'mername': '紫荆园_二层大伙', 'username': '测试'}
+    base.update(fields)
+    return {key: value for key, value in base.items() if value is not ...}
+
+
+def baseline_is_meal(row):
+    # The rule process_data used before the typed table
+    return 'mername' in row and row.get('summary') in MEAL_SUMMARIES
+
+
+def both_paths(rows):
+    """The table built from a payload dict and from a streamed JSON dump."""
+    text = json.dumps(payload(rows), ensure_ascii=False)
+    return load_transactions(payload(rows)), load_transactions_stream(io.StringIO(text), chunk_rows=2)
+
+
+def test_log_json_meals_match_baseline_rule():
+    with open(LOG_PATH, 'r', encoding='utf-8') as f:
+        rows = json.load(f)['resultData']['rows']
+    table = load_transactions(payload(rows))
+    assert (table['kind'] == 'meal').tolist() == [baseline_is_meal(r) for r in rows]
+
+
+@pytest.mark.parametrize('mername, meal', [
+    ('紫荆园_二层大伙', True),
+    ('', True),
+    (None, True),
+    (..., False),
+])
+def test_meal_with_empty_or_missing_merchant(mername, meal):
+    rows = [row(mername=mername), row(summary='水控POS消费流水', mername='南区26号东楼_淋浴')]
+    assert baseline_is_meal(rows[0]) == meal
+    for table in both_paths(rows):
+        assert (table['kind'].iloc[0] == 'meal') == meal
+        assert table['kind'].iloc[1] != 'meal'
+
+
+def test_other_timestamp_shapes_parse():
+    rows = [row(txdate='2025-03-01 12:00:00'), row(txdate='2025-03-01T12:30:00'),
+            row(txdate='2025-03-01 13:00:00.500')]
+    for table in both_paths(rows):
+        assert table['txdate'].tolist() == [pd.Timestamp('2025-03-01 12:00:00'), pd.Timestamp('2025-03-01 12:30:00'),
+                                            pd.Timestamp('2025-03-01 13:00:00.500')]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_stream_finds_rows_key_not_rows_text(chunk_size):
+    rows = [row(txamt=100 + i, meraddr='"rows": [') for i in range(5)]
+    document = {
+        "message": 'a message mentioning "rows": [{"txamt": 1}]',
+        "meta": {"rows": [row(txamt=1)]},
+        "resultData": {"totalpage": 12345, "note": "rows", "rows": rows, "total": len(rows)},
+        "success": True,
+    }
+    text = json.dumps(document, ensure_ascii=False)
+    assert list(iter_json_rows(io.StringIO(text), chunk_size)) == rows
+    assert list(iter_json_rows(io.StringIO('{"message": "no data"}'), chunk_size)) == []
@@ -0,0 +1,82 @@
+import os
+import sys
+from datetime import date
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import jobs
+from utils.analyze_data import get_costs, get_top_counters
+from utils.batch import build_report
+from utils.jobs import StageMemo, _running_metrics, compute_report, compute_year
+from utils.process_data import process_data
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log.json')
+
+
+@pytest.fixture(autouse=True)
+def memo(monkeypatch):
+    memo = StageMemo(size=8, ttl=3600)
+    monkeypatch.setattr(jobs, '_memo', memo)
+    monkeypatch.setattr(jobs, '_running', StageMemo(size=8, ttl=3600))
+    return memo
+
+
+def report(start, end):
+    return compute_report('id', 'cookie', start, end, LOG_PATH)
+
+
+def test_range_change_reuses_parsed_records():
+    assert report(date(2024, 1, 1), date(2024, 12, 31))['stages'] == {'ingest': 'miss', 'merge': 'miss',
+                                                                      'metrics': 'miss'}
+    assert report(date(2024, 3, 1), date(2024, 6, 30))['stages'] == {'ingest': 'hit', 'merge': 'miss',
+                                                                    'metrics': 'miss'}
+    assert report(date(2024, 1, 1), date(2024, 12, 31))['stages'] == {'ingest': 'hit', 'merge': 'hit',
+                                                                      'metrics': 'hit'}
+
+
+def test_memoized_stages_give_the_same_report():
+    fresh = report(date(2024, 3, 1), date(2024, 6, 30))
+    again = report(date(2024, 3, 1), date(2024, 6, 30))
+    assert again['stages']['merge'] == 'hit'
+    assert again['costs'] == fresh['costs'] and again['top_counters'].equals(fresh['top_counters'])
+
+
+def test_year_reuses_the_report_ranges_meals(memo):
+    report(date(2024, 1, 1), date(2024, 12, 31))
+    assert compute_year('id', 'cookie', 2024, LOG_PATH) == build_report(LOG_PATH, date(2024, 1, 1), date(2024, 12, 31))
+    assert memo.stats['merge'] == {'hits': 1, 'misses': 1}
+
+
+def test_refresh_folds_in_only_new_meals():
+    rows, merged = process_data(LOG_PATH)
+    start, key = rows['txdate'].iloc[0].date(), ('id', 'cookie')
+    # The first two thirds, then the day's new transactions arrive
+    _, status = _running_metrics(key, start, rows.iloc[:len(rows) * 2 // 3])
+    assert status == 'miss'
+    running, status = _running_metrics(key, start, rows)
+    assert status == 'hit'
+    np.testing.assert_allclose(running.get_costs(), get_costs(merged), rtol=1e-9)
+    assert list(running.get_top_counters().items()) == list(get_top_counters(merged).items())
+
+
+def test_changed_earlier_rows_rebuild_the_running_metrics():
+    rows, merged = process_data(LOG_PATH)
+    start, key = rows['txdate'].iloc[0].date(), ('id', 'cookie')
+    _running_metrics(key, start, rows.iloc[:-10])
+    corrected = rows.copy()
+    corrected.iloc[0, corrected.columns.get_loc('txamt')] += 1.0
+    running, status = _running_metrics(key, start, corrected)
+    assert status == 'miss'
+    assert running.get_costs()[1] == pytest.approx(get_costs(merged)[1] + 1.0)
+
+
+def test_memo_is_bounded_and_expires(monkeypatch):
+    memo = StageMemo(size=2, ttl=10)
+    for i in range(3):
+        memo.put('merge', i, i)
+    assert memo.get('merge', 0) is None and memo.get('merge', 2) == 2
+    now = jobs.time.time()
+    monkeypatch.setattr(jobs.time, 'time', lambda: now + 11)
+    assert memo.get('merge', 2) is None
@@ -0,0 +1,22 @@
+import os
+import sys
+import json
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.loadtest import run_load
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log.json')
+
+
+def test_sessions_stream_one_batched_comment_request_each():
+    with open(LOG_PATH, 'r', encoding='utf-8') as f:
+        rows = json.load(f)['resultData']['rows']
+    result = run_load(4, rows, date(2024, 1, 1), date(2024, 12, 31), workers=2, duplicates=0.5,
+                      card_latency=0.0, llm_latency=0.0, poll=0.05, ramp=0.0)
+    assert result['errors'] == [] and result['completed'] == 4
+    # Comments for every card come from a single request per session, as on the page
+    assert result['llm_requests'] == 4
+    assert 0 < result['first_card_p50'] <= result['p50']
+    # Sessions repeating a student join the first one's report job
+    assert result['jobs']['submitted'] == 2 and result['jobs']['deduplicated'] == 2
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.merchants import MERCHANT_KINDS, MerchantRegistry, merchant_kind
+
+
+def test_kinds_follow_interning():
+    registry = MerchantRegistry()
+    names = ['紫荆园_米饭', '南区26号东楼_淋浴', '饮水机BOT', '学生卡成本']
+    codes = registry.codes(pd.Series(names, name='mername'))
+    expected = [MERCHANT_KINDS.index(merchant_kind(name, 'mername')) for name in names]
+    assert registry.kinds(codes).tolist() == expected
+    # Names interned after a lookup are visible to the next one
+    late = registry.intern('桃李园_面条', 'mername')
+    assert registry.kinds(np.array([late, -1])).tolist() == [MERCHANT_KINDS.index('counter'), -1]
+
+
+def test_codes_are_stable_and_missing_is_minus_one():
+    registry = MerchantRegistry()
+    first = registry.codes(pd.Series(['紫荆园', None, '桃李园'], name='meraddr'))
+    second = registry.codes(pd.Series(['桃李园', '紫荆园'], name='meraddr'))
+    assert first[1] == -1 and first[0] != first[2]
+    assert second.tolist() == [first[2], first[0]]
+    assert len(registry) == 2
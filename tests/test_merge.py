@@ -0,0 +1,139 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.process_data import MERGE_WINDOW, merge_nearby, process_data
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log.json')
+
+
+def merge_iterrows(df):
+    """The original row-by-row merge loop `merge_nearby` replaced."""
+    merged_records = []
+    current_group = None
+
+    for _, row in df.iterrows():
+        if current_group is None:
+            current_group = {
+                'txdate': row['txdate'],
+                'txamt': row['txamt'],
+                'meraddr': row['meraddr'],
+                'mername': [row['mername']],
+                'username': row['username']
+            }
+        else:
+            time_diff = (row['txdate'] - current_group['txdate']).total_seconds() / 60
+
+            if time_diff <= 120 and row['meraddr'] == current_group['meraddr']:
+                current_group['txamt'] = round(current_group['txamt'] + row['txamt'], 2)
+                current_group['mername'].append(row['mername'])
+            else:
+                merged_records.append(current_group)
+                current_group = {
+                    'txdate': row['txdate'],
+                    'txamt': round(row['txamt'], 2),
+                    'meraddr': row['meraddr'],
+                    'mername': [row['mername']],
+                    'username': row['username']
+                }
+
+    if current_group is not None:
+        merged_records.append(current_group)
+    return pd.DataFrame(merged_records, columns=['txdate', 'txamt', 'meraddr', 'mername', 'username'])
+
+
+def meals(*rows):
+    """A sorted raw meal frame from (time, amount, meraddr, mername) tuples."""
+    return pd.DataFrame({
+        'txdate': pd.to_datetime([row[0] for row in rows]),
+        'txamt': [row[1] for row in rows],
+        'meraddr': [row[2] for row in rows],
+        'mername': [row[3] for row in rows],
+        'username': ['测试'] * len(rows),
+    }).astype({'txamt': float, 'meraddr': object, 'mername': object})
+
+
+def assert_same_merge(df):
+    expected = merge_iterrows(df)
+    actual = merge_nearby(df)
+    assert len(actual) == len(expected)
+    if len(expected):
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_log_json_matches_loop():
+    df, _ = process_data(LOG_PATH)
+    assert len(df) > 0
+    assert_same_merge(df)
+
+
+def test_empty_frame():
+    df = meals()
+    merged = merge_nearby(df)
+    assert merged.empty
+    assert list(merged.columns) == ['txdate', 'txamt', 'meraddr', 'mername', 'username']
+    # Empty results keep a datetime column, so `.dt` still works on them
+    assert merged['txdate'].dt.time.empty
+    assert merge_iterrows(df).empty
+
+
+def test_single_row():
+    assert_same_merge(meals(('2024-03-01 12:00:00', 12.5, '紫荆园', '紫荆园_米饭')))
+
+
+def test_same_timestamp_rows():
+    assert_same_merge(meals(
+        ('2024-03-01 12:00:00', 1.5, '紫荆园', '紫荆园_米饭'),
+        ('2024-03-01 12:00:00', 8.0, '紫荆园', '紫荆园_小炒'),
+        ('2024-03-01 12:00:00', 3.0, '桃李园', '桃李园_面条'),
+    ))
+
+
+@pytest.mark.parametrize('offset, merged', [
+    (MERGE_WINDOW, True),
+    (MERGE_WINDOW + pd.Timedelta(seconds=1), False),
+    (MERGE_WINDOW - pd.Timedelta(seconds=1), True),
+])
+def test_window_boundary(offset, merged):
+    start = pd.Timestamp('2024-03-01 11:00:00')
+    df = meals(
+        (start, 10.0, '紫荆园', '紫荆园_米饭'),
+        (start + offset, 2.0, '紫荆园', '紫荆园_汤'),
+    )
+    assert_same_merge(df)
+    assert len(merge_nearby(df)) == (1 if merged else 2)
+
+
+def test_long_run_splits_from_each_meals_first_record():
+    # Every record is within the window of the previous one, but not of the meal's first record
+    start = pd.Timestamp('2024-03-01 08:00:00')
+    df = meals(*((start + pd.Timedelta(minutes=50 * i), 1.0, '紫荆园', f'紫荆园_{i}') for i in range(8)))
+    assert_same_merge(df)
+
+
+def test_address_change_starts_new_meal():
+    assert_same_merge(meals(
+        ('2024-03-01 12:00:00', 5.0, '紫荆园', '紫荆园_米饭'),
+        ('2024-03-01 12:05:00', 5.0, '桃李园', '桃李园_面条'),
+        ('2024-03-01 12:10:00', 5.0, '紫荆园', '紫荆园_汤'),
+    ))
+
+
+def test_random_frames_match_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        n = int(rng.integers(1, 200))
+        minutes = np.sort(rng.integers(0, 60 * 24 * 3, n))
+        places = rng.choice(['紫荆园', '桃李园', '听涛园'], n)
+        df = pd.DataFrame({
+            'txdate': pd.Timestamp('2024-03-01') + pd.to_timedelta(minutes, unit='min'),
+            'txamt': np.round(rng.integers(50, 3000, n) / 100, 2),
+            'meraddr': places.astype(object),
+            'mername': [f'{place}_{i}' for i, place in enumerate(places)],
+            'username': ['测试'] * n,
+        })
+        assert_same_merge(df)
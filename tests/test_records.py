@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analyze_data import get_max_cost, get_time_bounds
+from utils.ask_gpt import prompt_key
+from utils.prompts import get_eat_habbit_batch_prompt
+from utils.records import HIGHLIGHT_TITLES, commentary_records, format_meal
+from utils.process_data import process_data
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log.json')
+
+
+@pytest.fixture(scope='module')
+def metrics():
+    _, df = process_data(LOG_PATH)
+    earliest, latest = get_time_bounds(df)
+    return {'earliest': earliest, 'latest': latest, 'most_expensive': get_max_cost(df),
+            'shower_stats': {'count': 3, 'amount': 4.5, 'avg_amount': 1.5}}
+
+
+def test_format_meal_is_one_line():
+    record = {'txdate': pd.Timestamp('2024-03-01 12:05:30'), 'meraddr': '紫荆园', 'txamt': 12.5,
+              'mername': ['紫荆园_米饭', '紫荆园_小炒', '紫荆园_米饭']}
+    assert format_meal(record) == "时间 2024-03-01 12:05｜地点 紫荆园｜窗口 米饭×2、小炒｜金额 ¥12.50｜餐次 午餐"
+
+
+def test_prompt_does_not_depend_on_display_options(metrics):
+    keys = []
+    for width in (80, 20):
+        with pd.option_context('display.width', width, 'display.max_colwidth', width):
+            keys.append(prompt_key('stub', get_eat_habbit_batch_prompt('测试', commentary_records(metrics))))
+    assert keys[0] == keys[1]
+
+
+def test_shower_card_only_with_showers(metrics):
+    assert list(commentary_records(metrics)) == [*HIGHLIGHT_TITLES, 'shower']
+    assert list(commentary_records({**metrics, 'shower_stats': {'count': 0}})) == list(HIGHLIGHT_TITLES)
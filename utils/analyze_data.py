@@ -1,19 +1,21 @@
 import os
 import sys
-import json
-import platform
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import MinMaxScaler
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.process_data import process_data
+from utils.fonts import font_rc
+from utils.merchants import get_registry
+from utils.tracing import traced
 
+@traced('metric.time_bounds')
 def get_time_bounds(df):
     earliest = df.loc[df['time_only'].idxmin()]
     latest = df.loc[df['time_only'].idxmax()]
     return earliest, latest
 
+@traced('metric.costs')
 def get_costs(df):
     # 使用IQR方法过滤异常值
     Q1, Q3 = df['txamt'].quantile([0.25, 0.75])
@@ -26,66 +28,94 @@ def get_costs(df):
     
     return avg_cost, total_cost
 
+@traced('metric.top_locations')
 def get_top_locations(df):
     return df.groupby('meraddr').size().sort_values(ascending=False).head(3)
 
+@traced('metric.top_counters')
 def get_top_counters(df):
-    counter_counts = {}
-    for mername_list in df['mername']:
-        for counter in set(mername_list):
-            counter_counts[counter] = counter_counts.get(counter, 0) + 1
-    
-    return pd.Series(counter_counts).sort_values(ascending=False)
+    # 每顿饭里同一窗口只计一次：按 (餐次, 窗口编码) 去重后计数
+    counters = df['mername'].explode()
+    meals = np.repeat(np.arange(len(df)), np.fromiter(map(len, df['mername']), np.int64, len(df)))
+    codes = get_registry().codes(counters, 'mername')
+    # 次数相同的窗口按名称排序，结果不依赖哈希种子
+    return get_registry().count_distinct(meals, codes).sort_index().sort_values(ascending=False, kind='stable')
 
+@traced('metric.max_cost')
 def get_max_cost(df):
     return df.loc[df['txamt'].idxmax()]
 
-def analyze_patterns(df):
-    def get_meal_type(hour):
-        if 5 <= hour < 10: return '早餐'
-        elif 10 <= hour < 15: return '午餐'
-        elif 15 <= hour < 21: return '晚餐'
-        else: return '夜宵'
-    
-    # 添加月份和用餐类型
-    df['month'] = df['txdate'].dt.month
-    df['meal_type'] = df['txdate'].dt.hour.map(get_meal_type)
-    
+MEAL_TYPES = ['早餐', '午餐', '晚餐', '夜宵']
+
+def get_meal_types(txdate):
+    # 按开始时间划分餐次：5-9 点早餐，10-14 点午餐，15-20 点晚餐，其余为夜宵
+    hour = txdate.dt.hour
+    return np.select([hour.between(5, 9), hour.between(10, 14), hour.between(15, 20)], MEAL_TYPES[:3], MEAL_TYPES[3])
+
+def _period_keys(txdate, freq):
+    if freq == 'month':
+        return txdate.dt.month
+    if freq == 'week':
+        return txdate.dt.to_period('W').astype(str)
+    if freq == 'semester':
+        # 春季学期 2-6 月，夏季学期 7-8 月，秋季学期 9 月至次年 1 月
+        month, year = txdate.dt.month, txdate.dt.year
+        term = np.select([month.between(2, 6), month.between(7, 8)], ['春', '夏'], '秋')
+        return (year - (month == 1)).astype(str) + pd.Series(term, index=txdate.index)
+    raise ValueError(f"unknown granularity: {freq}")
+
+@traced('metric.regularity')
+def get_regularity(df, freq='month'):
+    """
+    Time-of-day regularity per period in one vectorized pass.
+    `freq` is 'month' (month number, as in the report), 'week' or 'semester'.
+    Returns one row per period, in order of first appearance, with meal
+    counts per meal type, the std of meal time in seconds of day, and a
+    0-100 score where the steadiest period scores 100.
+    """
+    txdate = df['txdate']
+    table = pd.DataFrame({
+        'period': _period_keys(txdate, freq),
+        'seconds': txdate.dt.hour * 3600 + txdate.dt.minute * 60 + txdate.dt.second,
+        'meal_type': get_meal_types(txdate),
+    })
+    grouped = table.groupby('period', sort=False)
+    result = grouped['seconds'].agg(meals='size', std='std')
+    counts = pd.crosstab(table['period'], table['meal_type']).reindex(index=result.index, columns=MEAL_TYPES, fill_value=0)
+    result = pd.concat([counts, result], axis=1)
+
+    # 规律性得分：标准差做 min-max 归一化后取反
+    low, high = result['std'].min(), result['std'].max()
+    result['score'] = 100 * (1 - ((result['std'] - low) / (high - low) if high > low else 0.0))
+    return result.reset_index()
+
+def analyze_patterns(df, plot=True):
+    regularity = get_regularity(df, 'month')
+    months = df['txdate'].dt.month
+
     # 计算每月统计数据
     monthly_stats = {}
-    time_stds = []
-    
-    for month in df['month'].unique():
-        month_df = df[df['month'] == month]
-        time_secs = month_df['txdate'].dt.time.apply(
-            lambda x: x.hour * 3600 + x.minute * 60 + x.second
-        )
-        time_std = time_secs.std()
-        time_stds.append(time_std)
-        
-        monthly_stats[month] = {
-            'meals': month_df['meal_type'].value_counts(),
-            'std': time_std,
-            'data': month_df
+    for row in regularity.itertuples(index=False):
+        meals = pd.Series({meal: getattr(row, meal) for meal in MEAL_TYPES})
+        monthly_stats[row.period] = {
+            'meals': meals[meals > 0].sort_values(ascending=False),
+            'std': row.std,
+            'data': df[months == row.period],
+            'score': row.score,
         }
-    
-    # 计算规律性得分
-    scores = 100 * (1 - MinMaxScaler().fit_transform([[x] for x in time_stds]))
-    for month, score in zip(monthly_stats.keys(), scores):
-        monthly_stats[month]['score'] = score[0]
-    
+
     # 生成可视化
-    _plot_patterns(monthly_stats)
-    
+    if plot:
+        plot_patterns(monthly_stats)
+
     return monthly_stats
 
-def _plot_patterns(stats):
+def plot_patterns(stats):
+    # matplotlib 只在绘图时才导入，避免拖慢应用启动
+    import matplotlib.pyplot as plt
+
     # 设置字体
-    font = ('Arial Unicode MS' if platform.system() == "Darwin" else
-            'Droid Sans Fallback' if platform.system() == "Linux" else
-            'SimHei')
-    plt.rcParams['font.sans-serif'] = [font]
-    plt.rcParams['axes.unicode_minus'] = False
+    plt.rcParams.update(font_rc())
     
     # 找出最规律和最不规律的月份
     months = sorted(stats.items(), key=lambda x: x[1]['score'])
@@ -111,8 +141,7 @@ def _plot_patterns(stats):
     plt.show()
 
 def main():
-    data = json.load(open("log.json", "r", encoding='utf-8'))
-    df_raw, df = process_data(data)
+    df_raw, df = process_data("log.json")
     get_time_bounds(df)
     get_costs(df)
     get_top_locations(df)
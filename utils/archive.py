@@ -0,0 +1,98 @@
+import os
+import sys
+import argparse
+import typing as t
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.ingest import _CATEGORICAL, _FIELDS, _classify, load_transactions
+
+# Files with these suffixes are read by `load_transactions` as archives
+ARCHIVE_SUFFIXES = (".arrow", ".feather")
+ARCHIVE_VERSION = "1"
+# zstd roughly halves the file again; "uncompressed" keeps it zero-copy memory-mappable
+ARCHIVE_COMPRESSION = "zstd"
+
+
+def _schema():
+    import pyarrow as pa
+
+    labels = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [
+            ("txdate", pa.timestamp("us")),
+            ("txamt", pa.int64()),
+            *((name, labels) for name in _CATEGORICAL),
+            ("username", labels),
+        ],
+        metadata={"thu-food-archive": ARCHIVE_VERSION},
+    )
+
+
+def is_archive(path: t.Any) -> bool:
+    return isinstance(path, (str, os.PathLike)) and os.fspath(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def export_transactions(data: t.Any, path: t.Union[str, os.PathLike],
+                        compression: t.Optional[str] = ARCHIVE_COMPRESSION) -> int:
+    """
+    Write a payload (dict, JSON path or table) as an Arrow IPC file holding
+    only the fields the report reads, with amounts in integer cents and
+    summary, meraddr, mername and username dictionary-encoded.
+    Returns the size of the written file in bytes.
+    """
+    import pyarrow as pa
+
+    table = load_transactions(data)
+    frame = table[_FIELDS].astype({"username": "category"})
+    arrow = pa.Table.from_pandas(frame, schema=_schema(), preserve_index=False).replace_schema_metadata(
+        _schema().metadata)
+    options = pa.ipc.IpcWriteOptions(compression=None if compression == "uncompressed" else compression)
+    # Write then rename so an interrupted export never leaves a truncated archive
+    tmp = f"{os.fspath(path)}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, arrow.schema, options=options) as writer:
+        writer.write_table(arrow)
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def load_archive(path: t.Union[str, os.PathLike], memory_map: bool = True) -> pd.DataFrame:
+    """
+    Read an archive written by `export_transactions` into the table returned
+    by `load_transactions`. `kind` is recomputed, so archives follow the
+    current classification rules.
+    """
+    import pyarrow as pa
+
+    source = pa.memory_map(os.fspath(path)) if memory_map else pa.OSFile(os.fspath(path))
+    with source, pa.ipc.open_file(source) as reader:
+        version = (reader.schema.metadata or {}).get(b"thu-food-archive")
+        if version != ARCHIVE_VERSION.encode():
+            raise ValueError(f"{os.fspath(path)} is not a version {ARCHIVE_VERSION} transaction archive")
+        table = reader.read_all().to_pandas()
+    # Arrow hands strings back as its own dtype; missing names stay missing rather than becoming "None"
+    username = table["username"].astype(object)
+    table["username"] = username.where(username.notna(), None)
+    table["kind"] = _classify(table)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert querySelfTradeList payloads to compact Arrow archives")
+    parser.add_argument('inputs', nargs='+', help="payload JSON files")
+    parser.add_argument('--out-dir', help="where to write <name>.arrow (default: next to each input)")
+    parser.add_argument('--compression', default=ARCHIVE_COMPRESSION, choices=['zstd', 'lz4', 'uncompressed'])
+    args = parser.parse_args()
+
+    for source in args.inputs:
+        name = os.path.splitext(os.path.basename(source))[0] + ARCHIVE_SUFFIXES[0]
+        target = os.path.join(args.out_dir or os.path.dirname(source), name)
+        if args.out_dir:
+            os.makedirs(args.out_dir, exist_ok=True)
+        size = export_transactions(source, target, args.compression)
+        print(f"{source} ({os.path.getsize(source):,} B) -> {target} ({size:,} B)")
+
+
+if __name__ == "__main__":
+    main()
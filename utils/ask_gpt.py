@@ -1,35 +1,123 @@
 import os
-from openai import OpenAI
+import re
+import sys
+import json
+import hashlib
+import threading
+import unicodedata
+from functools import lru_cache
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.cache import CACHE_DIR
+from utils.prompts import get_json_repair_prompt
+from utils.tracing import span
+
 # Load environment variables
 load_dotenv()
 
-def ask_gpt(prompt, model=None, api_key=None, base_url=None):
-    if model is None:
-        model = os.getenv('MODEL', 'gemini-2.0-flash-exp')
-    
+LLM_CACHE_DIR = os.path.join(CACHE_DIR, 'llm')
+
+# Clients kept alive at once; on a shared server every visitor may bring their own key
+CLIENT_CACHE_SIZE = 8
+
+@lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def get_client(api_key, base_url):
+    """
+    Share one client (and its connection pool) per API key and endpoint.
+    Only the most recently used few are kept, so visitors' keys are not held
+    for the life of the process.
+    """
+    # openai is the slowest import in the app; defer it to the first request
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+def prompt_key(model, prompt):
+    """
+    Stable hex key of a (model, prompt) pair. Line endings and Unicode
+    composition are normalized, so prompts that only differ in those share
+    a key; the prompt text itself should come from value-based serializers
+    such as `utils.records.format_meal`, not from object reprs.
+    """
+    prompt = unicodedata.normalize('NFC', prompt.replace('\r\n', '\n'))
+    return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+def _cache_path(model, prompt):
+    # Content-addressed: identical (model, prompt) pairs never pay for a second call
+    digest = prompt_key(model, prompt)
+    return os.path.join(LLM_CACHE_DIR, digest[:2], f"{digest}.txt")
+
+def _json_cache_path(model, prompt):
+    # Validated JSON replies live next to the raw text cache, under the same key
+    digest = prompt_key(model, prompt)
+    return os.path.join(LLM_CACHE_DIR, digest[:2], f"{digest}.json")
+
+def _write_cache(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so concurrent readers never see a partial file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+def _iter_deltas(response, path=None):
+    """Yield text deltas from a streamed completion, caching the full text once it ends."""
+    parts = []
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    if path and parts:
+        _write_cache(path, ''.join(parts))
+
+def _create(client, model, messages, stream, json_mode):
+    if not json_mode:
+        return client.chat.completions.create(model=model, messages=messages, stream=stream)
+    from openai import BadRequestError
+    try:
+        return client.chat.completions.create(model=model, messages=messages, stream=stream,
+                                              response_format={"type": "json_object"})
+    except BadRequestError:
+        # Endpoints without JSON mode still get the prompt's own format instructions
+        return client.chat.completions.create(model=model, messages=messages, stream=stream)
+
+def _model(model):
+    return model if model is not None else os.getenv('MODEL', 'gemini-2.0-flash-exp')
+
+def ask_gpt(prompt, model=None, api_key=None, base_url=None, cache=True, stream=False, json_mode=False):
+    """
+    Return the completion text, or with `stream=True` an iterator of text deltas.
+    A cached completion is returned whole (as a single delta when streaming).
+    `json_mode` asks the endpoint for a JSON object reply where supported.
+    """
+    model = _model(model)
+
     if api_key is None:
         api_key = os.getenv('API_KEY')
         
     if base_url is None:
         base_url = os.getenv('BASE_URL')
 
+    path = _cache_path(model, prompt)
+    if cache and os.path.exists(path):
+        with span('llm.cached'), open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return iter([content]) if stream else content
+
     messages = [
         {"role": "user", "content": prompt},
     ]
     
     try:
-        client = OpenAI(
-            api_key=api_key,
-            base_url=base_url
-        )
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages
-        )
-        return response.choices[0].message.content
-        
+        with span('llm.client'):
+            client = get_client(api_key, base_url)
+        # For streams this covers the request up to the response headers
+        with span('llm.request', model=model, stream=stream):
+            response = _create(client, model, messages, stream, json_mode)
+        if stream:
+            return _iter_deltas(response, path if cache else None)
+        content = response.choices[0].message.content
+
     except Exception as e:
         print(f"❌ 请求失败！请检查以下配置：")
         print(f"API Key: {api_key}")
@@ -38,6 +126,159 @@ def ask_gpt(prompt, model=None, api_key=None, base_url=None):
         print(f"错误信息: {str(e)}")
         raise e
 
+    if cache and content:
+        _write_cache(path, content)
+    return content
+
+def _repair_json(text):
+    """
+    Best-effort fix of a model's JSON object: drops code fences and text
+    around the object, escapes raw newlines inside strings, removes trailing
+    commas and closes a reply cut off mid-string or mid-object.
+    """
+    start = text.find('{')
+    if start < 0:
+        raise ValueError("no JSON object in reply")
+    out, closers, in_string, escaped = [], [], False, False
+    for ch in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch in '\n\r\t':
+                ch = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}[ch]
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            closers.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            out.append(ch)
+            if closers:
+                closers.pop()
+            if not closers:
+                break
+            continue
+        out.append(ch)
+    if escaped:
+        out.pop()
+    if in_string:
+        out.append('"')
+    while out and (out[-1].isspace() or out[-1] in ',:'):
+        out.pop()
+    # A key cut off before its value is dropped
+    repaired = ''.join(out)
+    if closers and closers[-1] == '}':
+        repaired = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"$', r'\1', repaired).rstrip(',')
+    return repaired + ''.join(closers[::-1])
+
+def parse_json_object(text, keys):
+    """
+    Parse a reply that should be a JSON object with a string for each of
+    `keys`, repairing common defects first; one level of wrapping (such as
+    {"comments": {...}}) is unwrapped. Raises ValueError when keys are still missing.
+    """
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = json.loads(_repair_json(text))
+    if isinstance(value, dict) and not any(key in value for key in keys):
+        nested = [v for v in value.values() if isinstance(v, dict)]
+        if len(nested) == 1:
+            value = nested[0]
+    if not isinstance(value, dict):
+        raise ValueError("reply is not a JSON object")
+    missing = [key for key in keys if not isinstance(value.get(key), str) or not value[key].strip()]
+    if missing:
+        raise ValueError(f"reply is missing {', '.join(missing)}")
+    return {key: value[key].strip() for key in keys}
+
+def partial_json_fields(text, keys):
+    """String values of `keys` found so far in a JSON object still being streamed, unfinished ones included."""
+    fields = {}
+    for key in keys:
+        match = re.search(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)' % re.escape(key), text)
+        if not match:
+            continue
+        raw = match.group(1)
+        # Trim a cut-off escape sequence until the prefix decodes
+        for end in range(len(raw), max(len(raw) - 6, 0) - 1, -1):
+            try:
+                fields[key] = json.loads(f'"{raw[:end]}"')
+                break
+            except ValueError:
+                continue
+    return fields
+
+def _parse_or_repair(text, keys, model, api_key, base_url):
+    try:
+        return parse_json_object(text, keys)
+    except ValueError:
+        # One extra round trip, only when the local repair could not recover the reply
+        with span('llm.repair'):
+            fixed = ask_gpt(get_json_repair_prompt(text, keys), model, api_key, base_url, cache=False, json_mode=True)
+        return parse_json_object(fixed, keys)
+
+def _cached_json(path, keys):
+    if path is None or not os.path.exists(path):
+        return None
+    with span('llm.cached'), open(path, 'r', encoding='utf-8') as f:
+        try:
+            return parse_json_object(f.read(), keys)
+        except ValueError:
+            return None
+
+def ask_gpt_json(prompt, keys, model=None, api_key=None, base_url=None, cache=True):
+    """
+    Ask one prompt for a JSON object of `keys` -> text; see `parse_json_object`.
+    Only validated objects are cached, so a malformed reply is asked again next time.
+    """
+    model = _model(model)
+    path = _json_cache_path(model, prompt) if cache else None
+    value = _cached_json(path, keys)
+    if value is None:
+        text = ask_gpt(prompt, model, api_key, base_url, cache=False, json_mode=True)
+        value = _parse_or_repair(text, keys, model, api_key, base_url)
+        if path:
+            _write_cache(path, json.dumps(value, ensure_ascii=False))
+    return value
+
+def stream_json(prompt, keys, model=None, api_key=None, base_url=None, cache=True):
+    """
+    Stream one prompt whose reply is a JSON object of `keys` -> text,
+    yielding `(key, text so far)` whenever a value grows, then the validated
+    (and if need be repaired) final values that differ from what was shown.
+    A cached reply yields each value once; only validated objects are cached.
+    """
+    model = _model(model)
+    path = _json_cache_path(model, prompt) if cache else None
+    cached = _cached_json(path, keys)
+    if cached is not None:
+        yield from cached.items()
+        return
+    text, shown = "", {}
+    with span('llm.stream', keys=len(keys)):
+        for delta in ask_gpt(prompt, model, api_key, base_url, cache=False, stream=True, json_mode=True):
+            text += delta
+            for key, value in partial_json_fields(text, keys).items():
+                if shown.get(key) != value:
+                    shown[key] = value
+                    yield key, value
+    final = _parse_or_repair(text, keys, model, api_key, base_url)
+    if path:
+        _write_cache(path, json.dumps(final, ensure_ascii=False))
+    for key in keys:
+        if shown.get(key) != final[key]:
+            yield key, final[key]
+
 # test
 if __name__ == '__main__':
-    print(ask_gpt('hi there'))
\ No newline at end of file
+    print(ask_gpt('hi there'))
@@ -0,0 +1,195 @@
+import os
+import sys
+import csv
+import json
+import html
+import time
+import argparse
+import tempfile
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analyze_data import (
+    get_costs,
+    get_max_cost,
+    get_time_bounds,
+    get_top_counters,
+    get_top_locations,
+)
+from utils.archive import ARCHIVE_SUFFIXES
+from utils.bonus import get_card_stats, get_shower_stats
+from utils.get_eat_record import DEFAULT_END, DEFAULT_START
+from utils.ingest import load_transactions
+from utils.periods import select_range
+from utils.process_data import process_data
+from utils.tracing import Trace, span
+
+
+def _meal(record):
+    return {
+        'time': record['txdate'].strftime('%Y-%m-%d %H:%M'),
+        'place': str(record['meraddr']),
+        'counters': sorted(set(record['mername'])),
+        'amount': float(record['txamt']),
+    }
+
+
+def build_report(data, start=None, end=None, merged=None):
+    """
+    Compute every report metric for one student's payload (dict, path or
+    table), restricted to the inclusive date range when given. `merged` is
+    `process_data`'s result for the same rows when already at hand.
+    Raises ValueError when the range holds no meals.
+    """
+    transactions = select_range(load_transactions(data), start, end)
+    _, df = merged if merged is not None else process_data(transactions)
+    if df.empty:
+        raise ValueError("no meals in the selected date range")
+    avg_cost, total_cost = get_costs(df)
+    earliest, latest = get_time_bounds(df)
+    return {
+        'username': str(df['username'].iloc[0]),
+        'meals': len(df),
+        'total_cost': round(float(total_cost), 2),
+        'avg_cost': round(float(avg_cost), 2),
+        'top_locations': {str(k): int(v) for k, v in get_top_locations(df).items()},
+        'top_counters': {str(k): int(v) for k, v in get_top_counters(df).head().items()},
+        'earliest': _meal(earliest),
+        'latest': _meal(latest),
+        'most_expensive': _meal(get_max_cost(df)),
+        'shower': get_shower_stats(transactions),
+        'card': get_card_stats(transactions),
+    }
+
+
+def render_html(report):
+    rows = lambda items: ''.join(
+        f"<tr><td>{html.escape(str(k))}</td><td>{html.escape(str(v))}</td></tr>" for k, v in items)
+    meals = [('清晨觅食冠军', report['earliest']), ('夜宵王者', report['latest']), ('土豪餐王', report['most_expensive'])]
+    return f"""<!DOCTYPE html>
+<html lang="zh"><head><meta charset="utf-8"><title>{html.escape(report['username'])} 的食堂消费总结</title></head>
+<body>
+<h1>{html.escape(report['username'])} 的食堂消费总结</h1>
+<p>一共吃了 ¥{report['total_cost']:.2f}，共 {report['meals']} 顿，平均每顿 ¥{report['avg_cost']:.2f}</p>
+<h2>主力探店地</h2><table>{rows(report['top_locations'].items())}</table>
+<h2>心头好</h2><table>{rows(report['top_counters'].items())}</table>
+<h2>最逆天的一餐</h2><table>{rows((title, f"{m['time']} {m['place']} ¥{m['amount']:.2f}") for title, m in meals)}</table>
+<h2>Bonus</h2>
+<p>洗澡 {report['shower']['count']} 次，共 ¥{report['shower']['amount']:.2f}；补卡 {report['card']['count']} 次，共 ¥{report['card']['amount']:.2f}</p>
+</body></html>
+"""
+
+
+def run_job(name, source, out_dir, start=None, end=None, trace=None):
+    """
+    Build and write one student's reports; `source` is a payload path or an
+    (idserial, servicehall) pair. Payloads are reported over the whole file
+    unless a range is given; fetched students default to the 2025 range.
+    With `trace` set to 'time' or 'memory', also returns the job's spans as a JSON line.
+    """
+    if trace:
+        with Trace(name, memory=trace == 'memory') as job_trace:
+            _, elapsed, _ = run_job(name, source, out_dir, start, end)
+        return name, elapsed, job_trace.to_json(job=name)
+    began = time.perf_counter()
+    if isinstance(source, tuple):
+        from utils.cache import get_cache
+        source = get_cache().get_record(source[1], source[0], start or DEFAULT_START, end or DEFAULT_END)
+    report = build_report(source, start, end)
+    with span('write'):
+        for ext, content in (('json', json.dumps(report, ensure_ascii=False, indent=2)), ('html', render_html(report))):
+            path = os.path.join(out_dir, f"{name}.{ext}")
+            # Write then rename so an interrupted run never leaves a report that looks complete
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(f"{path}.tmp", path)
+    return name, time.perf_counter() - began, None
+
+
+def collect_jobs(input_dir=None, credentials=None):
+    jobs = {}
+    if input_dir:
+        for filename in sorted(os.listdir(input_dir)):
+            name, ext = os.path.splitext(filename)
+            if ext == '.json' or ext in ARCHIVE_SUFFIXES:
+                jobs[name] = os.path.join(input_dir, filename)
+    if credentials:
+        with open(credentials, 'r', encoding='utf-8') as f:
+            for idserial, servicehall in csv.reader(f):
+                jobs[idserial] = (idserial, servicehall)
+    return jobs
+
+
+def run_batch(jobs, out_dir, workers=None, resume=True, quiet=False, start=None, end=None,
+              trace=None, trace_log=None):
+    """
+    Run all jobs over a process pool, skipping finished students when resuming. Returns students/sec.
+    With `trace`, each job's spans are appended to `trace_log` as one JSON object per line.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if resume:
+        jobs = {name: source for name, source in jobs.items()
+                if not all(os.path.exists(os.path.join(out_dir, f"{name}.{ext}")) for ext in ('json', 'html'))}
+    if not jobs:
+        if not quiet:
+            print("所有报告均已生成，无需重跑（使用 --no-resume 强制重新生成）")
+        return 0.0
+
+    began = time.perf_counter()
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(trace_log if trace_log else os.devnull, 'a', encoding='utf-8') as log:
+        futures = {pool.submit(run_job, name, source, out_dir, start, end, trace): name for name, source in jobs.items()}
+        for future in as_completed(futures):
+            try:
+                _, elapsed, spans = future.result()
+                done += 1
+                status = f"{elapsed:.2f}s"
+                if spans:
+                    log.write(spans + "\n")
+            except Exception as e:
+                failed += 1
+                status = f"失败: {e}"
+            if not quiet:
+                print(f"[{done + failed}/{len(jobs)}] {futures[future]} {status}", flush=True)
+    throughput = done / (time.perf_counter() - began)
+    if not quiet:
+        print(f"完成 {done} 人，失败 {failed} 人，{throughput:.1f} students/sec")
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate reports for a whole cohort")
+    parser.add_argument('--input-dir', help="directory of payload files, one <name>.json or <name>.arrow per student")
+    parser.add_argument('--credentials', help="CSV of idserial,servicehall pairs to fetch")
+    parser.add_argument('--out-dir', default='reports')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--no-resume', action='store_true', help="regenerate reports that already exist")
+    parser.add_argument('--scaling', action='store_true', help="measure throughput from 1 worker up to --workers")
+    parser.add_argument('--start', type=date.fromisoformat, help="first day of the report range (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, help="last day of the report range (YYYY-MM-DD)")
+    parser.add_argument('--trace-log', help="append per-stage timings of every job to this JSON lines file")
+    parser.add_argument('--trace-memory', action='store_true', help="also record peak memory per stage (slower)")
+    args = parser.parse_args()
+
+    jobs = collect_jobs(args.input_dir, args.credentials)
+    if not jobs:
+        parser.error("no students found; pass --input-dir and/or --credentials")
+
+    if args.scaling:
+        workers = 1
+        while workers <= args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                throughput = run_batch(jobs, tmp, workers, resume=False, quiet=True, start=args.start, end=args.end)
+            print(f"{workers:>3} workers: {throughput:.1f} students/sec")
+            workers *= 2
+        return
+
+    trace = ('memory' if args.trace_memory else 'time') if args.trace_log else None
+    run_batch(jobs, args.out_dir, args.workers, resume=not args.no_resume, start=args.start, end=args.end,
+              trace=trace, trace_log=args.trace_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import os
+import sys
+import json
+import time
+import platform
+import copy
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import analyze_data
+from utils.archive import export_transactions
+from utils.ask_gpt import ask_gpt_json, stream_json
+from utils.bonus import get_card_stats, get_shower_stats
+from utils.charts import calendar_heatmap_spec, merchant_spending, merchant_spending_png, merchant_spending_spec
+from utils.cohort import KLLSketch
+from utils.cube import build_cube
+from utils.get_eat_record import get_record
+from utils.incremental import IncrementalReport
+from utils.ingest import load_transactions
+from utils.process_data import merge_nearby, process_data
+from utils.prompts import get_eat_habbit_batch_prompt
+from utils.records import commentary_records, estimate_tokens
+from utils.stub_server import StubCardServer, StubLLMServer
+from utils.synthetic import generate_payload
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, '.benchmarks', 'results.jsonl')
+# Stub LLM timings; the llm.* benchmarks track round trips and parsing, not a real model
+LLM_LATENCY = 0.05
+LLM_TOKEN_LATENCY = 0.001
+
+
+class Fixture:
+    """Inputs for one size, built lazily from a synthetic payload and shared by every benchmark."""
+
+    def __init__(self, size, tmp, seed=0):
+        self.size, self.tmp, self.seed = size, tmp, seed
+        self._values = {}
+        self._servers = []
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self._values:
+            self._values[name] = getattr(self, f'_build_{name}')()
+        return self._values[name]
+
+    def _build_payload(self):
+        return generate_payload(self.size, seed=self.seed)
+
+    def _build_json_path(self):
+        path = os.path.join(self.tmp, f'synthetic_{self.size}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.payload, f, ensure_ascii=False, indent=4)
+        return path
+
+    def _build_archive_path(self):
+        path = os.path.join(self.tmp, f'synthetic_{self.size}.arrow')
+        export_transactions(self.table, path)
+        return path
+
+    def _build_table(self):
+        return load_transactions(self.payload)
+
+    def _build_frames(self):
+        return process_data(self.table)
+
+    def _build_spending(self):
+        return merchant_spending(self.frames[0])
+
+    def _build_cube(self):
+        return build_cube(self.frames[1])
+
+    def _build_last_day(self):
+        rows = self.frames[0]
+        last = rows['txdate'].dt.normalize() == rows['txdate'].max().normalize()
+        return rows[~last], rows[last]
+
+    def _build_running(self):
+        # Running metrics before the last day, which a daily refresh then adds
+        return IncrementalReport().update(self.last_day[0])
+
+    def _build_date_range(self):
+        txdate = self.table['txdate']
+        return txdate.min().date(), txdate.max().date()
+
+    def _build_card_server(self):
+        return self._serve(StubCardServer(self.payload['resultData']['rows']))
+
+    def _build_llm_server(self):
+        return self._serve(StubLLMServer(latency=LLM_LATENCY, token_latency=LLM_TOKEN_LATENCY))
+
+    def _build_comment_prompt(self):
+        df = self.frames[1]
+        earliest, latest = analyze_data.get_time_bounds(df)
+        records = commentary_records({'earliest': earliest, 'latest': latest,
+                                      'most_expensive': analyze_data.get_max_cost(df),
+                                      'shower_stats': get_shower_stats(self.table)})
+        return get_eat_habbit_batch_prompt(str(df['username'].iloc[0]), records), list(records)
+
+    def _build_cohort_values(self):
+        # One log-normal yearly total per student, `size` students
+        return np.random.default_rng(self.seed).lognormal(8.5, 0.5, self.size)
+
+    def _build_cohort_sketch(self):
+        return _sketch(self.cohort_values)
+
+    def _serve(self, server):
+        server.__enter__()
+        self._servers.append(server)
+        return server
+
+    def close(self):
+        for server in self._servers:
+            server.__exit__(None, None, None)
+
+
+def _merge_iterrows(df):
+    """The row-by-row merge loop `merge_nearby` replaced, timed for comparison."""
+    merged_records = []
+    current_group = None
+
+    for _, row in df.iterrows():
+        if current_group is not None and row['meraddr'] == current_group['meraddr'] \
+                and (row['txdate'] - current_group['txdate']).total_seconds() / 60 <= 120:
+            current_group['txamt'] = round(current_group['txamt'] + row['txamt'], 2)
+            current_group['mername'].append(row['mername'])
+            continue
+        if current_group is not None:
+            merged_records.append(current_group)
+        current_group = {'txdate': row['txdate'], 'txamt': round(row['txamt'], 2), 'meraddr': row['meraddr'],
+                         'mername': [row['mername']], 'username': row['username']}
+
+    if current_group is not None:
+        merged_records.append(current_group)
+    return pd.DataFrame(merged_records)
+
+
+def _fold(batches):
+    report = IncrementalReport()
+    for batch in batches:
+        report.update(batch)
+    return report.get_costs()
+
+
+def _sketch(values, shards=8):
+    # Split over partial sketches and merged, as the bulk cohort builder does
+    merged = KLLSketch()
+    for i in range(shards):
+        partial = KLLSketch(seed=i)
+        partial.extend(values[i::shards])
+        merged.merge(partial)
+    return merged
+
+
+def _ask_llm(f, stream):
+    prompt, keys = f.comment_prompt
+    base_url = f.llm_server.base_url
+    if stream:
+        return list(stream_json(prompt, keys, 'stub', 'stub', base_url, cache=False))
+    return ask_gpt_json(prompt, keys, 'stub', 'stub', base_url, cache=False)
+
+
+def _first_card(f):
+    prompt, keys = f.comment_prompt
+    start = time.perf_counter()
+    for _ in stream_json(prompt, keys, 'stub', 'stub', f.llm_server.base_url, cache=False):
+        return time.perf_counter() - start
+
+
+def _peak_memory(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _load_whole(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return load_transactions(json.load(f))
+
+
+def _import_app():
+    subprocess.run([sys.executable, '-c', 'import st'], cwd=ROOT, capture_output=True, check=True)
+
+
+def _rank_error(f, probes=100):
+    values = f.cohort_values
+    chosen = np.random.default_rng(f.seed).choice(values, probes)
+    return float(max(abs(f.cohort_sketch.rank(value) - (values < value).mean()) for value in chosen))
+
+
+# (name, function of the fixture); names group as <area>.<what>
+BENCHMARKS = [
+    ('ingest.dict', lambda f: load_transactions(f.payload)),
+    ('ingest.json', lambda f: load_transactions(f.json_path)),
+    ('ingest.archive', lambda f: load_transactions(f.archive_path)),
+    ('process.merge', lambda f: merge_nearby(f.frames[0])),
+    ('process.merge.iterrows', lambda f: _merge_iterrows(f.frames[0])),
+    ('process.process_data', lambda f: process_data(f.table)),
+    ('analyze.get_time_bounds', lambda f: analyze_data.get_time_bounds(f.frames[1])),
+    ('analyze.get_costs', lambda f: analyze_data.get_costs(f.frames[1])),
+    ('analyze.get_top_locations', lambda f: analyze_data.get_top_locations(f.frames[1])),
+    ('analyze.get_top_counters', lambda f: analyze_data.get_top_counters(f.frames[1])),
+    ('analyze.get_max_cost', lambda f: analyze_data.get_max_cost(f.frames[1])),
+    ('analyze.get_regularity.month', lambda f: analyze_data.get_regularity(f.frames[1], 'month')),
+    ('analyze.get_regularity.week', lambda f: analyze_data.get_regularity(f.frames[1], 'week')),
+    ('analyze.get_regularity.semester', lambda f: analyze_data.get_regularity(f.frames[1], 'semester')),
+    ('analyze.analyze_patterns', lambda f: analyze_data.analyze_patterns(f.frames[1], plot=False)),
+    ('incremental.fold', lambda f: _fold([f.frames[0]])),
+    ('incremental.refresh', lambda f: copy.deepcopy(f.running).update(f.last_day[1]).get_costs()),
+    ('bonus.get_shower_stats', lambda f: get_shower_stats(f.table)),
+    ('bonus.get_card_stats', lambda f: get_card_stats(f.table)),
+    ('cube.build', lambda f: build_cube(f.frames[1])),
+    ('cube.matrix', lambda f: f.cube.matrix('month')),
+    ('cube.calendar', lambda f: f.cube.calendar()),
+    ('chart.calendar', lambda f: calendar_heatmap_spec(f.cube.calendar())),
+    ('chart.merchant_spending', lambda f: merchant_spending(f.frames[0])),
+    ('chart.vega', lambda f: merchant_spending_spec(f.spending)),
+    ('fetch.stub', lambda f: get_record('stub', 'stub', *f.date_range, base_url=f.card_server.base_url)),
+    ('cohort.build', lambda f: _sketch(f.cohort_values)),
+    ('cohort.rank', lambda f: [f.cohort_sketch.rank(value) for value in f.cohort_values[:1000]]),
+    # Depends only on the number of counters, so it runs at the smallest size only
+    ('chart.png', lambda f: merchant_spending_png(f.spending)),
+    ('llm.batch', lambda f: _ask_llm(f, stream=False)),
+    ('llm.stream', lambda f: _ask_llm(f, stream=True)),
+    ('startup.import_st', lambda f: _import_app()),
+]
+SIZE_INDEPENDENT = {'chart.png', 'chart.png.bytes', 'chart.vega.bytes', 'llm.batch', 'llm.stream', 'llm.prompt.tokens',
+                    'llm.stream.first_card', 'startup.import_st'}
+# Benchmarks too slow to run beyond a size
+SIZE_LIMITS = {'process.merge.iterrows': 10_000, 'fetch.stub': 10_000}
+
+# (name, unit, function of the fixture) for sizes and other values measured once per run
+MEASURES = [
+    ('ingest.json.bytes', 'B', lambda f: os.path.getsize(f.json_path)),
+    ('ingest.archive.bytes', 'B', lambda f: os.path.getsize(f.archive_path)),
+    ('ingest.json.peak_memory', 'B', lambda f: _peak_memory(load_transactions, f.json_path)),
+    ('ingest.json_load.peak_memory', 'B', lambda f: _peak_memory(_load_whole, f.json_path)),
+    ('cohort.rank_error', '', _rank_error),
+    ('chart.png.bytes', 'B', lambda f: len(merchant_spending_png(f.spending))),
+    ('chart.vega.bytes', 'B',
+     lambda f: len(json.dumps(merchant_spending_spec(f.spending), ensure_ascii=False).encode('utf-8'))),
+    ('llm.prompt.tokens', 'tokens', lambda f: estimate_tokens(f.comment_prompt[0])),
+    ('llm.stream.first_card', 's', _first_card),
+]
+UNITS = {name: unit for name, unit, _ in MEASURES}
+
+
+def _best_of(fn, fixture, repeat):
+    fn(fixture)  # warm up, and build any fixture values outside the timing
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(fixture)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'machine': platform.node(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def _runs_at(name, size, sizes, only):
+    if only and not any(pattern in name for pattern in only):
+        return False
+    if name in SIZE_INDEPENDENT:
+        return size == min(sizes)
+    return size <= SIZE_LIMITS.get(name, size)
+
+
+def run_suite(sizes, repeat=5, only=None, seed=0):
+    """Best-of-`repeat` seconds per `<benchmark>@<size>` key, and the `MEASURES` under the same keys."""
+    results, measures = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            fixture = Fixture(size, tmp, seed)
+            try:
+                for name, fn in BENCHMARKS:
+                    if _runs_at(name, size, sizes, only):
+                        seconds = _best_of(fn, fixture, 1 if name in SIZE_INDEPENDENT else repeat)
+                        results[f'{name}@{size}'] = seconds
+                        print(f"{name:<34} {size:>9} {seconds * 1e3:>11.3f} ms", flush=True)
+                for name, unit, fn in MEASURES:
+                    if _runs_at(name, size, sizes, only):
+                        value = measures[f'{name}@{size}'] = fn(fixture)
+                        print(f"{name:<34} {size:>9} {_format(value, unit):>14}", flush=True)
+            finally:
+                fixture.close()
+    return results, measures
+
+
+def _format(value, unit):
+    if unit == 'B':
+        return f"{value / 2**20:.2f} MB" if value >= 2**20 else f"{value:,} B"
+    if unit == 's':
+        return f"{value * 1e3:.3f} ms"
+    return f"{value:.4g} {unit}".rstrip()
+
+
+def load_history(path=RESULTS):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(results, baseline, threshold=1.2, measures=None):
+    """
+    Print each timing, then each measure, against `baseline`; returns the keys
+    slower (or larger) by more than `threshold`.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<44} {'before':>14} {'now':>14} {'ratio':>7}")
+    for section, values in (('results', results), ('measures', measures or {})):
+        for key, value in values.items():
+            before = baseline.get(section, {}).get(key)
+            if before is None:
+                continue
+            ratio = value / before if before else float('inf') if value else 1.0
+            flag = ' slower' if ratio > threshold else ' faster' if ratio < 1 / threshold else ''
+            if section == 'measures':
+                flag = {' slower': ' larger', ' faster': ' smaller'}.get(flag, '')
+            if ratio > threshold:
+                regressions.append(key)
+            unit = 's' if section == 'results' else UNITS.get(key.split('@')[0], '')
+            print(f"{key:<44} {_format(before, unit):>14} {_format(value, unit):>14} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic payloads and track results")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000], help="rows per payload")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', help="run benchmarks whose name contains any of these substrings")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', default=RESULTS, help="JSON lines file the run is appended to")
+    parser.add_argument('--compare', default='last',
+                        help="earlier run to compare against: 'last', a commit, or 'none'")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument('--no-save', action='store_true', help="do not append this run to --results")
+    args = parser.parse_args()
+
+    history = load_history(args.results)
+    results, measures = run_suite(args.sizes, args.repeat, args.only, args.seed)
+    run = {**_environment(), 'sizes': args.sizes, 'seed': args.seed, 'results': results, 'measures': measures}
+
+    if args.compare != 'none':
+        candidates = [r for r in history if args.compare == 'last' or r.get('commit') == args.compare]
+        if candidates:
+            baseline = candidates[-1]
+            print(f"\ncompared with {baseline.get('commit')} ({baseline['timestamp']})")
+            regressions = compare(results, baseline, args.threshold, measures)
+            if regressions:
+                print(f"{len(regressions)} benchmark(s) worse than {args.threshold}x: " + ", ".join(regressions))
+        else:
+            print("\nno earlier run to compare against")
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(run, ensure_ascii=False) + '\n')
+        print(f"results appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
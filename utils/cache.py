@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.get_eat_record import DEFAULT_END, DEFAULT_START, get_record
+
+load_dotenv()
+
+CACHE_DIR = os.getenv('CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'thu-food')
+# Entries older than this are refetched in full, so server-side corrections are picked up
+CACHE_TTL = float(os.getenv('CACHE_TTL') or 7 * 24 * 3600)
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES') or 200 * 2**20)
+
+# Bumped whenever the tables change; older caches are dropped and refilled
+_VERSION = 2
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    student TEXT NOT NULL,
+    id TEXT NOT NULL,
+    txdate TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (student, id)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    student TEXT PRIMARY KEY,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+"""
+
+
+def student_key(idserial, servicehall):
+    """
+    Cache key of one student's rows: the idserial together with a digest of
+    the servicehall cookie they were fetched with, so cached rows are only
+    ever served to a caller holding the same credentials.
+    """
+    return f"{idserial}:{hashlib.sha256(servicehall.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _row_id(row):
+    return str(row.get('id') or json.dumps(row, sort_keys=True, ensure_ascii=False))
+
+
+def _payload(rows):
+    return {
+        "message": "成功",
+        "resultData": {"totalpage": 1, "total": len(rows), "size": len(rows), "currentPage": 0, "rows": rows},
+    }
+
+
+class RecordCache:
+    """
+    On-disk SQLite cache of decrypted trade rows per student (see
+    `student_key`). Each student keeps the date range already covered;
+    later requests only fetch transactions from the high-water mark on
+    `txdate` onwards (plus any uncovered earlier range) and append them.
+    Fetches for different students run concurrently; concurrent requests
+    for the same student wait for each other, so the second one is a hit.
+    """
+
+    def __init__(self, path=None, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, fetch=get_record):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'records.sqlite3')
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self.stats = {'hits': 0, 'partial': 0, 'misses': 0, 'fetched_rows': 0}
+        # Guards `stats` and `_students`: student key -> (lock, number of callers using it)
+        self._lock = threading.Lock()
+        self._students = {}
+        with self._connect() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != _VERSION:
+                conn.executescript("DROP TABLE IF EXISTS rows; DROP TABLE IF EXISTS coverage;")
+                conn.execute(f"PRAGMA user_version = {_VERSION}")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextmanager
+    def _student(self, student):
+        with self._lock:
+            lock, users = self._students.get(student, (None, 0))
+            lock = lock or threading.Lock()
+            self._students[student] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                users = self._students[student][1] - 1
+                if users:
+                    self._students[student] = (lock, users)
+                else:
+                    del self._students[student]
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self.stats[stat] += n
+
+    def _fetch_rows(self, servicehall, idserial, start, end):
+        rows = self.fetch(servicehall, idserial, start, end)['resultData']['rows']
+        self._count('fetched_rows', len(rows))
+        return rows
+
+    def get_record(self, servicehall, idserial, start=DEFAULT_START, end=DEFAULT_END):
+        """Drop-in replacement for `get_record` that serves cached rows where possible."""
+        student = student_key(idserial, servicehall)
+        with self._student(student):
+            now = time.time()
+            with self._connect() as conn:
+                cov = conn.execute(
+                    "SELECT start, end, created_at, fetched_at FROM coverage WHERE student = ?", (student,)
+                ).fetchone()
+                if cov is not None and now - cov[2] > self.ttl:
+                    self._delete(conn, student)
+                    cov = None
+
+                ranges = []
+                if cov is None:
+                    ranges.append((start, end))
+                    cov_start, cov_end, created_at = start, end, now
+                else:
+                    cov_start, cov_end = date.fromisoformat(cov[0]), date.fromisoformat(cov[1])
+                    created_at = cov[2]
+                    if start < cov_start:
+                        ranges.append((start, cov_start - timedelta(days=1)))
+                    # The covered range is complete only if it was fetched after it ended
+                    complete_until = min(cov_end, datetime.fromtimestamp(cov[3]).date() - timedelta(days=1))
+                    if end > complete_until:
+                        hwm = conn.execute("SELECT MAX(txdate) FROM rows WHERE student = ?", (student,)).fetchone()[0]
+                        since = max(start, date.fromisoformat(hwm[:10]) if hwm else cov_start, cov_start)
+                        ranges.append((min(since, complete_until + timedelta(days=1)), end))
+                    cov_start, cov_end = min(start, cov_start), max(end, cov_end)
+
+            # Network calls happen outside any transaction, so other students' reads and writes go ahead
+            fetched = [self._fetch_rows(servicehall, idserial, *window) for window in ranges]
+            self._count('misses' if cov is None else 'partial' if ranges else 'hits')
+
+            with self._connect() as conn:
+                for rows in fetched:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO rows (student, id, txdate, body) VALUES (?, ?, ?, ?)",
+                        [(student, _row_id(row), row['txdate'], json.dumps(row, ensure_ascii=False)) for row in rows],
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?, ?)",
+                    (student, cov_start.isoformat(), cov_end.isoformat(), created_at,
+                     now if ranges else cov[3], now),
+                )
+                bodies = conn.execute(
+                    "SELECT body FROM rows WHERE student = ? AND txdate >= ? AND txdate < ? ORDER BY txdate DESC",
+                    (student, start.isoformat(), (end + timedelta(days=1)).isoformat()),
+                ).fetchall()
+                with self._lock:
+                    busy = set(self._students)
+                self._evict(conn, keep=busy)
+
+        return _payload([json.loads(body) for body, in bodies])
+
+    def years(self, servicehall, idserial, first, last):
+        """
+        Years in `first..last` that may hold records for the student: from the
+        earlier of `first` and their earliest cached record, leaving out years
+        the cache has fully fetched and found empty.
+        """
+        student = student_key(idserial, servicehall)
+        with self._connect() as conn:
+            cov = conn.execute("SELECT start, end, fetched_at FROM coverage WHERE student = ?", (student,)).fetchone()
+            found = {int(year) for year, in conn.execute(
+                "SELECT DISTINCT substr(txdate, 1, 4) FROM rows WHERE student = ?", (student,)
+            )}
+        if cov is None:
+            return list(range(first, last + 1))
+        cov_start = date.fromisoformat(cov[0])
+        complete_until = min(date.fromisoformat(cov[1]), datetime.fromtimestamp(cov[2]).date() - timedelta(days=1))
+        first = min([first, *found])
+        return [year for year in range(first, last + 1)
+                if year in found or not cov_start <= date(year, 1, 1) <= date(year, 12, 31) <= complete_until]
+
+    def _delete(self, conn, student):
+        conn.execute("DELETE FROM rows WHERE student = ?", (student,))
+        conn.execute("DELETE FROM coverage WHERE student = ?", (student,))
+
+    def _evict(self, conn, keep=()):
+        """Drop expired students, then least recently used ones until under `max_bytes`; `keep` are in use."""
+        for student, in conn.execute(
+            "SELECT student FROM coverage WHERE created_at < ?", (time.time() - self.ttl,)
+        ).fetchall():
+            if student not in keep:
+                self._delete(conn, student)
+
+        sizes = conn.execute(
+            "SELECT c.student, COALESCE(SUM(LENGTH(r.body)), 0) FROM coverage c "
+            "LEFT JOIN rows r ON r.student = c.student GROUP BY c.student ORDER BY c.used_at"
+        ).fetchall()
+        total = sum(size for _, size in sizes)
+        for student, size in sizes:
+            if total <= self.max_bytes:
+                break
+            if student not in keep:
+                self._delete(conn, student)
+                total -= size
+
+    def hit_rate(self):
+        requests = self.stats['hits'] + self.stats['partial'] + self.stats['misses']
+        return self.stats['hits'] / requests if requests else 0.0
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide record cache."""
+    global _cache
+    if _cache is None:
+        _cache = RecordCache()
+    return _cache
+
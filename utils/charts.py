@@ -0,0 +1,96 @@
+import io
+import os
+import sys
+import typing as t
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fonts import font_rc
+from utils.tracing import traced
+
+
+def merchant_spending(df_raw: pd.DataFrame) -> pd.Series:
+    """Total spend per counter (`mername`), ascending, as plotted in the report."""
+    return df_raw.groupby('mername')['txamt'].sum().sort_values(ascending=True)
+
+
+@traced("chart.png")
+def merchant_spending_png(spending: pd.Series, dpi: int = 500) -> bytes:
+    """
+    Render the per-counter bar chart to PNG bytes.
+    Uses an explicit Figure and rc_context, so global pyplot state and
+    rcParams are left untouched.
+    """
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    height = len(spending) / 66 * 18
+    with matplotlib.rc_context(font_rc()):
+        fig = Figure(figsize=(12, height), dpi=dpi)
+        ax = fig.subplots()
+        bars = ax.barh(range(len(spending)), spending)
+        ax.bar_label(bars, labels=[f'¥{value:.2f}' for value in spending], padding=3, fontsize=6)
+        ax.set_yticks(range(len(spending)), spending.index, fontsize=8)
+        ax.set_xlabel('消费金额（元）', fontsize=10)
+        ax.set_title('各窗口消费总额', fontsize=12)
+        ax.set_xlim(0, 1.2 * max(spending))
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+@traced("chart.vega")
+def merchant_spending_spec(spending: pd.Series) -> t.Dict[str, t.Any]:
+    """
+    Vega-Lite spec of the same chart, built from the aggregated series only.
+    The browser lays out and renders it, so the payload is a few KB of JSON
+    regardless of resolution.
+    """
+    values = [{'mername': str(name), 'txamt': round(float(amount), 2)} for name, amount in spending.items()]
+    return {
+        '$schema': 'https://vega.github.io/schema/vega-lite/v5.json',
+        'title': '各窗口消费总额',
+        'data': {'values': values},
+        'height': {'step': 16},
+        'transform': [{'calculate': "'¥' + format(datum.txamt, '.2f')", 'as': 'label'}],
+        'encoding': {
+            'y': {'field': 'mername', 'type': 'nominal', 'sort': '-x', 'title': None},
+            'x': {'field': 'txamt', 'type': 'quantitative', 'title': '消费金额（元）'},
+            'tooltip': [{'field': 'mername', 'title': '窗口'}, {'field': 'label', 'title': '金额'}],
+        },
+        'layer': [
+            {'mark': {'type': 'bar'}},
+            {'mark': {'type': 'text', 'align': 'left', 'dx': 3, 'fontSize': 10},
+             'encoding': {'text': {'field': 'label'}}},
+        ],
+    }
+
+
+@traced("chart.calendar")
+def calendar_heatmap_spec(calendar: pd.DataFrame, measure: str = 'spend') -> t.Dict[str, t.Any]:
+    """
+    Vega-Lite spec of a GitHub-style calendar: one column per week, one row
+    per weekday, coloured by daily spend (or meal count), from
+    `SpendingCube.calendar`.
+    """
+    title = '每日消费（元）' if measure == 'spend' else '每日顿数'
+    values = calendar[['date', 'week', 'weekday', measure]].to_dict('records')
+    return {
+        '$schema': 'https://vega.github.io/schema/vega-lite/v5.json',
+        'title': '消费日历',
+        'data': {'values': values},
+        'mark': {'type': 'rect', 'cornerRadius': 2},
+        'width': {'step': 13},
+        'height': {'step': 13},
+        'encoding': {
+            'x': {'field': 'week', 'type': 'ordinal', 'title': None,
+                  'axis': {'labelExpr': "slice(datum.value, 5, 10)", 'labelAngle': -45, 'labelOverlap': True}},
+            'y': {'field': 'weekday', 'type': 'ordinal', 'title': None,
+                  'sort': ['周一', '周二', '周三', '周四', '周五', '周六', '周日']},
+            'color': {'field': measure, 'type': 'quantitative', 'title': title,
+                      'scale': {'scheme': 'greens', 'domainMin': 0}},
+            'tooltip': [{'field': 'date', 'title': '日期'}, {'field': measure, 'title': title}],
+        },
+    }
@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import math
+import random
+import argparse
+import typing as t
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.get_eat_record import DEFAULT_END, DEFAULT_START
+
+COHORT_PATH = os.getenv('COHORT_PATH') or 'cohort.json'
+COHORT_K = 200
+# Smaller cohorts are not ranked against, as a rank would say too much about the few others
+COHORT_MIN_STUDENTS = int(os.getenv('COHORT_MIN_STUDENTS') or 30)
+
+# Metrics ranked against the cohort: name -> (label, unit)
+METRICS = {
+    'total_cost': ('总消费', '元'),
+    'avg_cost': ('平均每顿', '元'),
+    'meals': ('吃饭顿数', '顿'),
+    'earliest': ('最早一餐', '分钟'),
+    'latest': ('最晚一餐', '分钟'),
+    'most_expensive': ('最贵一餐', '元'),
+    'showers': ('洗澡次数', '次'),
+}
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Keeps at most about 3k of the values added, in levels where an item at
+    level h stands for 2^h values; a full level is sorted and every other
+    item promoted. Rank error is around 1.7 / k with high probability
+    independently of how many values are added, and sketches built on
+    different shards merge into a sketch of the union with the same bound.
+    """
+
+    def __init__(self, k: int = COHORT_K, seed: t.Optional[int] = 0):
+        self.k = k
+        self.n = 0
+        self.levels: t.List[t.List[float]] = [[]]
+        self._rng = random.Random(seed)
+        self._frozen = None
+
+    def _capacity(self, level):
+        return max(2, math.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1)))
+
+    def _compress(self):
+        while sum(map(len, self.levels)) > sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, items in enumerate(self.levels):
+                if len(items) >= self._capacity(h):
+                    break
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+            items.sort()
+            # An odd item out stays behind at its level
+            kept = [items.pop()] if len(items) % 2 else []
+            self.levels[h + 1].extend(items[self._rng.randrange(2)::2])
+            self.levels[h] = kept
+
+    def update(self, value: float):
+        self.levels[0].append(float(value))
+        self.n += 1
+        self._frozen = None
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def extend(self, values: t.Iterable[float]):
+        for value in values:
+            self.update(value)
+
+    def merge(self, other: 'KLLSketch'):
+        """Fold `other` into this sketch in place; `other` is left unchanged."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self._frozen = None
+        self._compress()
+        return self
+
+    def _freeze(self):
+        # Sorted retained values with the cumulative weight below each one
+        if self._frozen is None:
+            values = np.concatenate([np.asarray(items, dtype=np.float64) for items in self.levels])
+            weights = np.concatenate([np.full(len(items), 2 ** h, dtype=np.int64) for h, items in enumerate(self.levels)])
+            order = np.argsort(values, kind='stable')
+            self._frozen = values[order], np.concatenate([[0], np.cumsum(weights[order])])
+        return self._frozen
+
+    def rank(self, value: float, inclusive: bool = False) -> float:
+        """Estimated fraction of added values below `value` (or equal to it, with `inclusive`)."""
+        if not self.n:
+            return float('nan')
+        values, below = self._freeze()
+        return float(below[np.searchsorted(values, value, side='right' if inclusive else 'left')] / below[-1])
+
+    def quantile(self, q: float) -> float:
+        if not self.n:
+            return float('nan')
+        values, below = self._freeze()
+        return float(values[min(np.searchsorted(below[1:], q * below[-1], side='left'), len(values) - 1)])
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {'k': self.k, 'n': self.n, 'levels': self.levels}
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any], seed: t.Optional[int] = 0) -> 'KLLSketch':
+        sketch = cls(data['k'], seed)
+        sketch.n = data['n']
+        sketch.levels = [list(items) for items in data['levels']]
+        return sketch
+
+
+def _minutes(when) -> int:
+    return when.hour * 60 + when.minute
+
+
+def student_metrics(meals, total_cost, avg_cost, earliest, latest, most_expensive, showers) -> t.Dict[str, float]:
+    """The values `CohortStats` ranks; `earliest` and `latest` are datetimes of the extreme meals."""
+    return {
+        'total_cost': float(total_cost),
+        'avg_cost': float(avg_cost),
+        'meals': float(meals),
+        'earliest': float(_minutes(earliest)),
+        'latest': float(_minutes(latest)),
+        'most_expensive': float(most_expensive),
+        'showers': float(showers),
+    }
+
+
+def report_metrics(report: t.Dict[str, t.Any]) -> t.Dict[str, float]:
+    """`student_metrics` of a `build_report` result."""
+    clock = lambda meal: datetime.strptime(meal['time'], '%Y-%m-%d %H:%M')
+    return student_metrics(report['meals'], report['total_cost'], report['avg_cost'], clock(report['earliest']),
+                           clock(report['latest']), report['most_expensive']['amount'], report['shower']['count'])
+
+
+class CohortStats:
+    """
+    One KLL sketch per metric in `METRICS`, built from many students' reports
+    over the date range [start, end]. Ranking a student needs only the
+    sketches, whose size does not grow with the cohort; stores built on
+    separate shards of the same range merge. A student is only comparable
+    with the store when their report covers the same range (see `covers`).
+    """
+
+    def __init__(self, start: t.Optional[date] = None, end: t.Optional[date] = None, k: int = COHORT_K,
+                 seed: t.Optional[int] = 0):
+        self.start = start
+        self.end = end
+        self.sketches = {metric: KLLSketch(k, seed) for metric in METRICS}
+
+    @property
+    def label(self) -> str:
+        return f"{self.start or ''}~{self.end or ''}"
+
+    def covers(self, start: date, end: date) -> bool:
+        """Whether reports over [start, end] can be ranked against this store; stores without a range never can."""
+        return self.start is not None and (self.start, self.end) == (start, end)
+
+    @property
+    def students(self) -> int:
+        return self.sketches['total_cost'].n
+
+    def add(self, values: t.Dict[str, float]):
+        for metric, sketch in self.sketches.items():
+            sketch.update(values[metric])
+
+    def merge(self, other: 'CohortStats'):
+        if (self.start, self.end) != (other.start, other.end):
+            raise ValueError(f"cannot merge cohort {other.label} into {self.label}")
+        for metric, sketch in self.sketches.items():
+            sketch.merge(other.sketches[metric])
+        return self
+
+    def below(self, metric: str, value: float) -> float:
+        """Estimated fraction of the cohort strictly below `value`."""
+        return self.sketches[metric].rank(value)
+
+    def above(self, metric: str, value: float) -> float:
+        """Estimated fraction of the cohort strictly above `value`."""
+        return 1.0 - self.sketches[metric].rank(value, inclusive=True)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {'start': self.start and self.start.isoformat(), 'end': self.end and self.end.isoformat(),
+                'sketches': {metric: sketch.to_dict() for metric, sketch in self.sketches.items()}}
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any]) -> 'CohortStats':
+        # Stores written before the range was recorded load without one and are never ranked against
+        day = lambda value: date.fromisoformat(value) if value else None
+        stats = cls(day(data.get('start')), day(data.get('end')))
+        stats.sketches = {metric: KLLSketch.from_dict(sketch) for metric, sketch in data['sketches'].items()}
+        return stats
+
+    def save(self, path: str = COHORT_PATH):
+        # Write then rename so readers never see a half-written store
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str = COHORT_PATH) -> t.Optional['CohortStats']:
+        """The store at `path`, or None when there is none."""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def _build_shard(sources, start, end, k, seed):
+    from utils.batch import build_report
+    stats, skipped = CohortStats(start, end, k, seed), 0
+    for source in sources:
+        if isinstance(source, tuple):
+            from utils.cache import get_cache
+            source = get_cache().get_record(source[1], source[0], start, end)
+        try:
+            stats.add(report_metrics(build_report(source, start, end)))
+        except ValueError:
+            skipped += 1
+    return stats.to_dict(), skipped
+
+
+def build_cohort(sources, start, end, workers=None, k=COHORT_K):
+    """
+    Sketch the metrics over [start, end] of every student in `sources`
+    (payload paths or (idserial, servicehall) pairs, as in `utils.batch`).
+    Each worker process builds a partial store over one shard and the
+    partials are merged. Returns the store and the number of students
+    without meals in the range.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sources)))
+    shards = [sources[i::workers] for i in range(workers)]
+    stats, skipped = CohortStats(start, end, k), 0
+    if workers == 1:
+        results = [_build_shard(shards[0], start, end, k, 0)]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_build_shard, shards, [start] * workers, [end] * workers, [k] * workers,
+                                    range(workers)))
+    for data, shard_skipped in results:
+        stats.merge(CohortStats.from_dict(data))
+        skipped += shard_skipped
+    return stats, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the cohort percentile store from many students' data")
+    parser.add_argument('--input-dir', help="directory of <idserial>.json payloads or .arrow archives")
+    parser.add_argument('--credentials', help="CSV file with idserial,servicehall per line")
+    parser.add_argument('--out', default=COHORT_PATH)
+    parser.add_argument('--start', type=date.fromisoformat, default=DEFAULT_START,
+                        help="the web page only ranks reports over exactly this range")
+    parser.add_argument('--end', type=date.fromisoformat, default=DEFAULT_END)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--k', type=int, default=COHORT_K, help="sketch size; rank error is about 1.7/k")
+    parser.add_argument('--update', action='store_true', help="merge into the existing store at --out")
+    args = parser.parse_args()
+
+    from utils.batch import collect_jobs
+    sources = list(collect_jobs(args.input_dir, args.credentials).values())
+    if not sources:
+        parser.error("no students found; pass --input-dir and/or --credentials")
+    stats, skipped = build_cohort(sources, args.start, args.end, args.workers, args.k)
+    if args.update:
+        previous = CohortStats.load(args.out)
+        if previous is not None:
+            stats = previous.merge(stats)
+    stats.save(args.out)
+    print(f"{stats.students} students ({stats.label}) -> {args.out} ({skipped} without meals skipped)")
+    for metric, (name, unit) in METRICS.items():
+        sketch = stats.sketches[metric]
+        print(f"  {name}: p10 {sketch.quantile(0.1):.1f} / p50 {sketch.quantile(0.5):.1f} / "
+              f"p90 {sketch.quantile(0.9):.1f} {unit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import typing as t
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analyze_data import MEAL_TYPES, get_meal_types
+from utils.tracing import traced
+
+GRAINS = ('day', 'week', 'month')
+DIMENSIONS = ('meraddr', 'meal_type')
+MEASURES = ('spend', 'meals', 'swipes')
+WEEKDAYS = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+
+
+def _period_start(day: pd.Series, grain: str) -> pd.Series:
+    if grain == 'day':
+        return day
+    if grain == 'week':
+        return day - pd.to_timedelta(day.dt.weekday, unit='D')
+    if grain == 'month':
+        return day - pd.to_timedelta(day.dt.day - 1, unit='D')
+    raise ValueError(f"unknown grain: {grain}")
+
+
+def _rollup(cells: pd.DataFrame, grain: str) -> pd.DataFrame:
+    keys = [_period_start(cells['period'], grain).rename('period'), cells['meraddr'], cells['meal_type']]
+    rolled = cells.groupby(keys, observed=True, sort=True)[list(MEASURES)].sum().reset_index()
+    return rolled.astype({measure: cells[measure].dtype for measure in MEASURES})
+
+
+class SpendingCube:
+    """
+    Spend and meal counts per period, canteen (`meraddr`) and meal type, at
+    day, week (starting Monday) and month grain.
+
+    Cells are only stored where there were meals; spend is kept in integer
+    cents and the dimensions as categoricals. Built once per report by
+    `build_cube`; every view below reads the cells, never the transactions.
+    """
+
+    def __init__(self, levels: t.Dict[str, pd.DataFrame]):
+        self.levels = levels
+
+    @property
+    def days(self) -> pd.DataFrame:
+        return self.levels['day']
+
+    def cells(self, grain: str = 'month', start: t.Optional[date] = None, end: t.Optional[date] = None,
+              **where) -> pd.DataFrame:
+        """Cells at `grain` whose period starts within [start, end], filtered by dimension values."""
+        cells = self.levels[grain]
+        mask = np.ones(len(cells), dtype=bool)
+        if start is not None:
+            mask &= (cells['period'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (cells['period'] <= pd.Timestamp(end)).to_numpy()
+        for dimension, value in where.items():
+            values = [value] if isinstance(value, str) else value
+            mask &= cells[dimension].isin(values).to_numpy()
+        return cells if mask.all() else cells[mask]
+
+    def totals(self, grain: str = 'month', measure: str = 'spend', **where) -> pd.Series:
+        """One value per period; spend in yuan."""
+        series = self.cells(grain, **where).groupby('period')[measure].sum()
+        return series / 100 if measure == 'spend' else series
+
+    def matrix(self, grain: str = 'month', by: str = 'meraddr', measure: str = 'spend', **where) -> pd.DataFrame:
+        """Periods × values of `by` (e.g. canteen by month); spend in yuan, empty cells 0."""
+        table = self.cells(grain, **where).pivot_table(index='period', columns=by, values=measure, aggfunc='sum',
+                                                       fill_value=0, observed=True)
+        table.columns = table.columns.astype(str)
+        return table / 100 if measure == 'spend' else table
+
+    def calendar(self, start: t.Optional[date] = None, end: t.Optional[date] = None) -> pd.DataFrame:
+        """
+        Every day of [start, end] (the data's span by default) with its spend
+        in yuan and meal count, the Monday of its week and its weekday, as
+        laid out in a calendar heatmap.
+        """
+        days = self.days.groupby('period')[['spend', 'meals']].sum()
+        if start is None or end is None:
+            if days.empty:
+                return pd.DataFrame(columns=['date', 'week', 'weekday', 'spend', 'meals'])
+            start, end = start or days.index.min().date(), end or days.index.max().date()
+        index = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq='D', unit='s', name='period')
+        days = days.reindex(index, fill_value=0)
+        return pd.DataFrame({
+            'date': index.strftime('%Y-%m-%d'),
+            'week': (index - pd.to_timedelta(index.weekday, unit='D')).strftime('%Y-%m-%d'),
+            'weekday': np.asarray(WEEKDAYS, dtype=object)[index.weekday],
+            'spend': days['spend'].to_numpy() / 100,
+            'meals': days['meals'].to_numpy(),
+        })
+
+    def nbytes(self) -> int:
+        return sum(int(level.memory_usage(deep=True).sum()) for level in self.levels.values())
+
+    def save(self, path: str):
+        """Write the day cells as Arrow IPC; coarser grains are rolled up again on load."""
+        self.days.reset_index(drop=True).to_feather(path, compression='zstd')
+
+    @classmethod
+    def load(cls, path: str) -> 'SpendingCube':
+        return cls.from_days(pd.read_feather(path))
+
+    @classmethod
+    def from_days(cls, days: pd.DataFrame) -> 'SpendingCube':
+        levels = {'day': days}
+        for grain in GRAINS[1:]:
+            levels[grain] = _rollup(days, grain)
+        return cls(levels)
+
+
+@traced('cube.build')
+def build_cube(df: pd.DataFrame) -> SpendingCube:
+    """
+    Aggregate `process_data`'s merged meals into a `SpendingCube`. Swipes are
+    the records each meal was merged from, so the raw frame is not rescanned.
+    """
+    txdate = df['txdate']
+    counters = df['mername'].to_numpy()
+    cells = pd.DataFrame({
+        'period': txdate.dt.floor('D').astype('datetime64[s]'),
+        'meraddr': pd.Categorical(df['meraddr'].astype(str)),
+        'meal_type': pd.Categorical(get_meal_types(txdate), categories=MEAL_TYPES),
+        'spend': np.rint(df['txamt'].to_numpy(dtype=float) * 100).astype(np.int64),
+        'meals': np.ones(len(df), dtype=np.int32),
+        'swipes': np.fromiter(map(len, counters), np.int32, len(counters)),
+    })
+    days = cells.groupby(['period', 'meraddr', 'meal_type'], observed=True, sort=True)[list(MEASURES)].sum()
+    days = days.reset_index().astype({'spend': np.int64, 'meals': np.int32, 'swipes': np.int32})
+    return SpendingCube.from_days(days)
@@ -0,0 +1,40 @@
+import platform
+import typing as t
+from functools import lru_cache
+
+# Preferred CJK families per platform, most preferred first
+_PREFERRED = {
+    'Darwin': ['PingFang SC', 'Heiti SC', 'Arial Unicode MS', 'Songti SC'],
+    'Windows': ['Microsoft YaHei', 'DengXian', 'SimHei', 'SimSun', 'KaiTi', 'FangSong'],
+    'Linux': ['Noto Sans CJK SC', 'Noto Sans CJK JP', 'Noto Sans CJK TC', 'Source Han Sans SC',
+              'WenQuanYi Micro Hei', 'WenQuanYi Zen Hei', 'Droid Sans Fallback'],
+}
+# Substrings that mark other installed families as able to render Chinese
+_CJK_HINTS = ('CJK', 'Han Sans', 'Han Serif', 'WenQuanYi', 'YaHei', 'Hei', 'Song')
+
+
+@lru_cache(maxsize=None)
+def cjk_fonts() -> t.Tuple[str, ...]:
+    """
+    Discover installed fonts able to render Chinese, once per process.
+    Looks only at matplotlib's font manager and never installs anything;
+    returns an empty tuple when no CJK font is available.
+    """
+    from matplotlib import font_manager
+
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    preferred = _PREFERRED.get(platform.system(), []) + [
+        name for names in _PREFERRED.values() for name in names
+    ]
+    found = [name for name in dict.fromkeys(preferred) if name in installed]
+    found += sorted(name for name in installed
+                    if name not in found and any(hint in name for hint in _CJK_HINTS))
+    return tuple(found)
+
+
+def font_rc() -> t.Dict[str, t.Any]:
+    """rcParams for Chinese labels, suitable for `matplotlib.rc_context` or `rcParams.update`."""
+    rc = {'axes.unicode_minus': False}
+    if cjk_fonts():
+        rc['font.sans-serif'] = list(cjk_fonts())
+    return rc
@@ -1,10 +1,33 @@
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import http.cookiejar
 import base64
 import requests
+import time
 import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.tracing import propagate, span
+
+# Overridable so tests and load tests can point every process at a local stub
+BASE_URL = os.getenv('CARD_BASE_URL') or "https://card.tsinghua.edu.cn"
+# Report range used when no dates are given
+DEFAULT_START = date(2025, 1, 1)
+DEFAULT_END = date(2025, 12, 31)
+PAGE_SIZE = 5000
+# Long date ranges are split into windows of this many days and fetched in parallel
+WINDOW_DAYS = 92
+MAX_WORKERS = 8
+RETRIES = 3
+BACKOFF = 0.5
+
+_session = None
 
 def decrypt_aes_ecb(encrypted_data: str) -> str:
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import unpad
     
     key = encrypted_data[:16].encode('utf-8')
     encrypted_data = encrypted_data[16:]
@@ -16,13 +39,102 @@ def decrypt_aes_ecb(encrypted_data: str) -> str:
 
     return decrypted_data.decode('utf-8')
 
-def get_record(servicehall, idserial):
-    # 获取数据
-    url = f"https://card.tsinghua.edu.cn/business/querySelfTradeList?pageNumber=0&pageSize=5000&starttime=2025-01-01&endtime=2025-12-31&idserial={idserial}&tradetype=-1"
-    cookie = {"servicehall": servicehall}
-    response = requests.post(url, cookies=cookie)
-    
-    encrypted_string = json.loads(response.text)["data"]
-    decrypted_string = decrypt_aes_ecb(encrypted_string)
-    data = json.loads(decrypted_string)
-    return data
\ No newline at end of file
+def decode_page(content):
+    """Decrypt and parse one querySelfTradeList response body (bytes)."""
+    encrypted = json.loads(content)["data"]
+    with span("fetch.decrypt", bytes=len(encrypted)):
+        plain = decrypt_aes_ecb(encrypted)
+    with span("fetch.parse"):
+        return json.loads(plain)
+
+class _NoCookies(http.cookiejar.DefaultCookiePolicy):
+    # The session is shared by every user of the process: cookies set by the
+    # server for one user must never be sent along with another user's requests
+    def set_ok(self, cookie, request):
+        return False
+
+def get_session():
+    """
+    Return a process-wide session so connections to the card API are pooled.
+    It never stores cookies; each request carries its own `servicehall`.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.cookies.set_policy(_NoCookies())
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+def split_windows(start, end, days=WINDOW_DAYS):
+    """Split the inclusive range [start, end] into consecutive non-overlapping windows."""
+    windows = []
+    while start <= end:
+        stop = min(start + timedelta(days=days - 1), end)
+        windows.append((start, stop))
+        start = stop + timedelta(days=1)
+    return windows
+
+def _retrying(fn):
+    for attempt in range(RETRIES + 1):
+        try:
+            return fn(attempt)
+        except (requests.RequestException, ValueError, KeyError):
+            if attempt == RETRIES:
+                raise
+            time.sleep(BACKOFF * 2 ** attempt)
+
+def download_page(servicehall, idserial, start, end, page, base_url=BASE_URL, session=None):
+    """Raw response body of one page of querySelfTradeList, retrying with exponential backoff."""
+    session = session or get_session()
+    url = (f"{base_url}/business/querySelfTradeList?pageNumber={page}&pageSize={PAGE_SIZE}"
+           f"&starttime={start:%Y-%m-%d}&endtime={end:%Y-%m-%d}&idserial={idserial}&tradetype=-1")
+
+    def attempt_download(attempt):
+        with span("fetch.request", page=page, attempt=attempt):
+            response = session.post(url, cookies={"servicehall": servicehall}, timeout=30)
+            response.raise_for_status()
+            return response.content
+    return _retrying(attempt_download)
+
+def fetch_page(servicehall, idserial, start, end, page, base_url=BASE_URL, session=None):
+    """Fetch and decrypt one page of querySelfTradeList, retrying with exponential backoff."""
+    return _retrying(lambda attempt: decode_page(
+        download_page(servicehall, idserial, start, end, page, base_url, session)))
+
+def _rows(page):
+    return (page.get("resultData", {}) or {}).get("rows", []) or []
+
+def _fetch_window(pool, servicehall, idserial, start, end, base_url, session):
+    first = fetch_page(servicehall, idserial, start, end, 0, base_url, session)
+    result = first.get("resultData", {}) or {}
+    pages = [first] + list(pool.map(
+        propagate(lambda page: fetch_page(servicehall, idserial, start, end, page, base_url, session)),
+        range(1, int(result.get("totalpage", 1) or 1))
+    ))
+    return [row for page in pages for row in _rows(page)]
+
+def get_record(servicehall, idserial, start=DEFAULT_START, end=DEFAULT_END, base_url=BASE_URL):
+    # 获取数据：按时间窗口和分页并发拉取，结果按服务端顺序（新→旧）合并；
+    # 窗口数不超过连接池大小，避免超出共享会话的连接上限
+    session = get_session()
+    windows = split_windows(start, end)[::-1]
+    with span("fetch", start=str(start), end=str(end)) as fetch_span, \
+            ThreadPoolExecutor(MAX_WORKERS) as pages_pool, \
+            ThreadPoolExecutor(min(len(windows), MAX_WORKERS) or 1) as windows_pool:
+        fetch_window = lambda window: _fetch_window(pages_pool, servicehall, idserial, *window, base_url, session)
+        results = list(windows_pool.map(propagate(fetch_window), windows))
+        fetch_span.set(rows=sum(map(len, results)))
+
+    rows = [row for window_rows in results for row in window_rows]
+    return {
+        "message": "成功",
+        "resultData": {
+            "totalpage": 1,
+            "total": len(rows),
+            "size": len(rows),
+            "currentPage": 0,
+            "rows": rows,
+        },
+    }
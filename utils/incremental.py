@@ -0,0 +1,188 @@
+import os
+import sys
+import copy
+import bisect
+import typing as t
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analyze_data import get_meal_types
+from utils.process_data import merge_nearby
+
+
+class _Welford:
+    """Running count, mean and sum of squared deviations."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+
+    def update(self, values: np.ndarray) -> None:
+        # Chan et al. parallel combination of the batch moments with the running ones
+        n = len(values)
+        if n == 0:
+            return
+        batch_mean = float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else float("nan")
+
+
+class IncrementalReport:
+    """
+    Running state behind the `analyze_data` metrics, updated in O(batch) time.
+
+    Feed it raw meal rows (the first frame returned by `process_data`) in
+    chronological batches. Each batch is merged together with the rows of
+    the meal still open at the end of the previous one, since later rows
+    may join it within the merge window; that meal is folded in once a
+    later meal starts, and the getters count it as it stands. Results match
+    the batch functions on the merged meals of all rows: counts, bounds and
+    maxima exactly, and the IQR-filtered average, totals and monthly
+    time-of-day std within 1e-9 relative error. Amounts are whole cents, so
+    an exact histogram serves as the quantile sketch for the IQR filter,
+    bounded by the number of distinct amounts.
+    """
+
+    def __init__(self):
+        self.meals = 0
+        self.total_cents = 0
+        self.amounts: Counter = Counter()
+        self.locations: Counter = Counter()
+        self.counters: Counter = Counter()
+        self.monthly: t.Dict[int, _Welford] = {}
+        self.monthly_meals: t.Dict[int, Counter] = {}
+        self.earliest = self.latest = self.most_expensive = None
+        # Raw rows of the last meal and that meal merged; not yet in the counts above
+        self._open_rows: t.Optional[pd.DataFrame] = None
+        self._open: t.Optional[pd.DataFrame] = None
+        self._view: t.Optional["IncrementalReport"] = None
+
+    def update(self, rows: pd.DataFrame) -> "IncrementalReport":
+        if rows.empty:
+            return self
+        if self._open_rows is not None:
+            rows = pd.concat([self._open_rows, rows], ignore_index=True)
+        merged = merge_nearby(rows)
+        merged['time_only'] = merged['txdate'].dt.time
+        # Meals are runs of consecutive rows, so the last one is the last len(mername) rows
+        self._open_rows = rows.iloc[len(rows) - len(merged['mername'].iloc[-1]):]
+        self._open = merged.iloc[-1:]
+        self._add(merged.iloc[:-1])
+        self._view = None
+        return self
+
+    def _current(self) -> "IncrementalReport":
+        """The counts with the open meal folded in, kept until the next update."""
+        if self._open is None:
+            return self
+        if self._view is None:
+            view = copy.copy(self)
+            view.amounts, view.locations, view.counters = Counter(self.amounts), Counter(self.locations), \
+                Counter(self.counters)
+            view.monthly = {month: copy.copy(stats) for month, stats in self.monthly.items()}
+            view.monthly_meals = {month: Counter(meals) for month, meals in self.monthly_meals.items()}
+            view._open_rows = view._open = view._view = None
+            self._view = view._add(self._open)
+        return self._view
+
+    def _add(self, merged: pd.DataFrame) -> "IncrementalReport":
+        if merged.empty:
+            return self
+        cents = np.rint(merged['txamt'].to_numpy(dtype=float) * 100).astype(np.int64)
+        self.meals += len(merged)
+        self.total_cents += int(cents.sum())
+        self.amounts.update(dict(zip(*np.unique(cents, return_counts=True))))
+        self.locations.update(merged['meraddr'].value_counts(sort=False).to_dict())
+        for names in merged['mername']:
+            self.counters.update(dict.fromkeys(names, 1))
+
+        txdate = merged['txdate']
+        seconds = (txdate.dt.hour * 3600 + txdate.dt.minute * 60 + txdate.dt.second).to_numpy(dtype=float)
+        months = txdate.dt.month.to_numpy()
+        meal_types = get_meal_types(txdate)
+        for month in pd.unique(months):
+            in_month = months == month
+            self.monthly.setdefault(month, _Welford()).update(seconds[in_month])
+            self.monthly_meals.setdefault(month, Counter()).update(meal_types[in_month])
+
+        # Ties keep the earliest record, as idxmin/idxmax do
+        earliest = merged.loc[merged['time_only'].idxmin()]
+        latest = merged.loc[merged['time_only'].idxmax()]
+        most_expensive = merged.loc[merged['txamt'].idxmax()]
+        if self.earliest is None or earliest['time_only'] < self.earliest['time_only']:
+            self.earliest = earliest
+        if self.latest is None or latest['time_only'] > self.latest['time_only']:
+            self.latest = latest
+        if self.most_expensive is None or most_expensive['txamt'] > self.most_expensive['txamt']:
+            self.most_expensive = most_expensive
+        return self
+
+    def _quantile(self, values: t.List[int], cumulative: t.List[int], q: float) -> float:
+        # Linear interpolation between order statistics, as in Series.quantile
+        position = (self.meals - 1) * q
+        lower = int(position)
+        below = values[bisect.bisect_right(cumulative, lower)]
+        above = values[bisect.bisect_right(cumulative, min(lower + 1, self.meals - 1))]
+        return below + (above - below) * (position - lower)
+
+    def get_costs(self) -> t.Tuple[float, float]:
+        if self._current() is not self:
+            return self._current().get_costs()
+        values = sorted(self.amounts)
+        cumulative = list(np.cumsum([self.amounts[v] for v in values]))
+        q1, q3 = (self._quantile(values, cumulative, q) for q in (0.25, 0.75))
+        iqr = q3 - q1
+        low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+        kept = [(v, self.amounts[v]) for v in values if low <= v <= high]
+        count = sum(n for _, n in kept)
+        avg_cost = sum(v * n for v, n in kept) / count / 100 if count else float("nan")
+        return avg_cost, self.total_cents / 100
+
+    def get_top_locations(self) -> pd.Series:
+        if self._current() is not self:
+            return self._current().get_top_locations()
+        counts = pd.Series(self.locations).sort_index()
+        return counts.sort_values(ascending=False).head(3)
+
+    def get_top_counters(self) -> pd.Series:
+        if self._current() is not self:
+            return self._current().get_top_counters()
+        # Ties ordered by name, as in analyze_data.get_top_counters
+        return pd.Series(self.counters).sort_index().sort_values(ascending=False, kind='stable')
+
+    def get_time_bounds(self) -> t.Tuple[pd.Series, pd.Series]:
+        if self._current() is not self:
+            return self._current().get_time_bounds()
+        return self.earliest, self.latest
+
+    def get_max_cost(self) -> pd.Series:
+        if self._current() is not self:
+            return self._current().get_max_cost()
+        return self.most_expensive
+
+    def monthly_stats(self) -> t.Dict[int, t.Dict[str, t.Any]]:
+        """Per-month meal counts, time-of-day std and regularity score as in `analyze_patterns`."""
+        if self._current() is not self:
+            return self._current().monthly_stats()
+        stds = {month: stats.std for month, stats in self.monthly.items()}
+        low, high = np.nanmin(list(stds.values())), np.nanmax(list(stds.values()))
+        return {
+            month: {
+                'meals': pd.Series(self.monthly_meals[month]).sort_values(ascending=False),
+                'std': std,
+                'score': 100 * (1 - ((std - low) / (high - low) if high > low else 0.0)),
+            }
+            for month, std in stds.items()
+        }
@@ -0,0 +1,213 @@
+import json
+import typing as t
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from utils.merchants import get_registry
+from utils.tracing import span
+
+# Transaction summaries counted as canteen meals
+MEAL_SUMMARIES = frozenset({"持卡人消费", "实体卡", "nfc卡消费", "离线码在线消费"})
+WATER_CONTROL_SUMMARY = "水控POS消费流水"
+CARD_REISSUE_SUMMARY = "自助补卡账户余额扣费"
+TOP_UP_SUMMARY = "中行圈存"
+
+KINDS = ("meal", "shower", "drinking-water", "card-reissue", "top-up", "other")
+
+# Only the fields the report reads are kept
+_FIELDS = ["txdate", "txamt", "summary", "meraddr", "mername", "username"]
+_CATEGORICAL = ["summary", "meraddr", "mername"]
+
+
+def _iter_rows(data: t.Any) -> t.List[t.Dict[str, t.Any]]:
+    """Safely get transaction rows from the raw API payload."""
+    if isinstance(data, dict):
+        result = data.get("resultData", {}) or {}
+        rows = result.get("rows", []) or []
+        if isinstance(rows, list):
+            return rows
+    return []
+
+
+def _category_mask(column: pd.Series, predicate: t.Callable[[str], bool]) -> np.ndarray:
+    """Evaluate `predicate` once per distinct value of a categorical column."""
+    categories = np.array([predicate(str(c)) for c in column.cat.categories] + [False])
+    # Missing values have code -1, which picks the trailing False
+    return categories[column.cat.codes.to_numpy()]
+
+
+def _classify(table: pd.DataFrame) -> pd.Categorical:
+    summary = table["summary"]
+    registry = get_registry()
+    mername = registry.codes(table["mername"], "mername")
+    meraddr = registry.codes(table["meraddr"], "meraddr")
+
+    is_water_control = _category_mask(summary, lambda s: s == WATER_CONTROL_SUMMARY)
+    is_drinking = is_water_control & registry.is_kind(mername, "drinking-water")
+    is_shower = is_water_control & registry.is_kind(mername, "shower")
+    is_card = (_category_mask(summary, lambda s: s == CARD_REISSUE_SUMMARY)
+               | registry.is_kind(mername, "card-cost") | registry.is_kind(meraddr, "card-cost"))
+    is_meal = _category_mask(summary, lambda s: s in MEAL_SUMMARIES) & (mername >= 0)
+    is_top_up = _category_mask(summary, lambda s: s == TOP_UP_SUMMARY) | registry.is_kind(meraddr, "top-up")
+
+    # Earlier conditions take precedence, so a card cost charge is never a meal
+    kind = np.select(
+        [is_card, is_meal, is_shower, is_drinking, is_top_up],
+        ["card-reissue", "meal", "shower", "drinking-water", "top-up"],
+        default="other",
+    )
+    return pd.Categorical(kind, categories=KINDS)
+
+
+def iter_json_rows(fp: t.TextIO, chunk_size: int = 1 << 16) -> t.Iterator[t.Dict[str, t.Any]]:
+    """
+    Incrementally yield the objects of `resultData.rows` from a JSON text stream.
+    Only the row being decoded and one read chunk are held in memory, so the
+    whole document is never materialized. Keys are matched as object keys at
+    their level, so "rows" appearing in a string or a nested object is skipped.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    whitespace = " \t\r\n"
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        chunk = fp.read(chunk_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+        return not eof
+
+    def skip(chars: str) -> None:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or not fill():
+                return
+
+    def expect(char: str) -> bool:
+        nonlocal pos
+        skip(whitespace)
+        if buf[pos:pos + 1] != char:
+            return False
+        pos += 1
+        return True
+
+    def value() -> t.Any:
+        nonlocal pos
+        skip(whitespace)
+        while True:
+            try:
+                result, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            # A number cut off at the end of the buffer still decodes; read on before trusting it
+            if end == len(buf) and fill():
+                continue
+            pos = end
+            return result
+
+    def keys() -> t.Iterator[str]:
+        # Each key of the object at `pos`; the caller consumes its value before asking for the next
+        if not expect("{"):
+            return
+        while True:
+            skip(whitespace + ",")
+            if buf[pos:pos + 1] != '"':
+                return
+            key = value()
+            if not expect(":"):
+                raise ValueError(f"expected ':' after key {key!r}")
+            yield key
+
+    for key in keys():
+        if key != "resultData":
+            value()
+            continue
+        for key in keys():
+            if key != "rows":
+                value()
+                continue
+            if not expect("["):
+                return
+            while True:
+                skip(whitespace + ",")
+                if pos >= len(buf) or buf[pos] == "]":
+                    return
+                yield value()
+        return
+
+
+def _build_table(rows: t.List[t.Dict[str, t.Any]]) -> pd.DataFrame:
+    records = pd.DataFrame.from_records(rows, columns=_FIELDS)
+    mername = records["mername"]
+    if mername.isna().any():
+        # A row with a null mername still counts as a meal, like one with an empty name;
+        # only rows without the field at all are not meals
+        present = np.fromiter(("mername" in row for row in rows), dtype=bool, count=len(rows))
+        mername = mername.mask(present & mername.isna().to_numpy(), "")
+    table = pd.DataFrame({
+        # ISO8601 keeps the fast path for "2025-01-01 12:00:00" and also accepts "T" and fractional seconds
+        "txdate": pd.to_datetime(records["txdate"], format="ISO8601"),
+        "txamt": pd.to_numeric(records["txamt"]).fillna(0).astype(np.int64),
+        **{name: records[name].astype("category") for name in _CATEGORICAL if name != "mername"},
+        "mername": mername.astype("category"),
+        "username": records["username"],
+    })
+    table["kind"] = _classify(table)
+    return table
+
+
+def _concat_tables(tables: t.List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate chunk tables, unioning categories instead of falling back to object."""
+    if len(tables) == 1:
+        return tables[0]
+    table = pd.concat(tables, ignore_index=True)
+    for name in _CATEGORICAL:
+        table[name] = union_categoricals([chunk[name] for chunk in tables])
+    return table
+
+
+def load_transactions_stream(fp: t.TextIO, chunk_rows: int = 10_000) -> pd.DataFrame:
+    """
+    Build the transaction table from a JSON text stream in bounded memory.
+    Rows are parsed incrementally and converted to typed columns every
+    `chunk_rows` rows, so peak memory no longer scales with the dict tree.
+    """
+    tables, rows = [], []
+    for row in iter_json_rows(fp):
+        rows.append({name: row[name] for name in _FIELDS if name in row})
+        if len(rows) >= chunk_rows:
+            tables.append(_build_table(rows))
+            rows = []
+    if rows or not tables:
+        tables.append(_build_table(rows))
+    return _concat_tables(tables)
+
+
+def load_transactions(data: t.Any) -> pd.DataFrame:
+    """
+    Parse the querySelfTradeList payload once into a typed columnar table.
+    Accepts the payload dict, a path to a JSON dump (parsed incrementally),
+    a path to an Arrow archive written by `utils.archive`, or an already
+    loaded table.
+    `txamt` is kept in integer cents and `kind` classifies every row as one of KINDS.
+    """
+    if isinstance(data, pd.DataFrame):
+        return data
+    with span("ingest") as ingest_span:
+        if isinstance(data, (str, bytes)) or hasattr(data, "__fspath__"):
+            from utils.archive import is_archive, load_archive
+            if is_archive(data):
+                table = load_archive(data)
+            else:
+                with open(data, "r", encoding="utf-8") as f:
+                    table = load_transactions_stream(f)
+        else:
+            table = _build_table(_iter_rows(data))
+        ingest_span.set(rows=len(table))
+    return table
@@ -0,0 +1,304 @@
+import os
+import sys
+import time
+import copy
+import hashlib
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.batch import build_report
+from utils.bonus import get_card_stats, get_shower_stats
+from utils.cache import CACHE_TTL
+from utils.charts import merchant_spending
+from utils.cohort import student_metrics
+from utils.cube import build_cube
+from utils.incremental import IncrementalReport
+from utils.ingest import load_transactions
+from utils.periods import select_range, year_range
+from utils.process_data import process_data
+from utils.tracing import propagate, span
+
+# Reports computed at once; further jobs wait in the queue up to REPORT_QUEUE_LIMIT
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS') or 4)
+REPORT_QUEUE_LIMIT = int(os.getenv('REPORT_QUEUE_LIMIT') or 32)
+# Finished reports are served to later identical requests for this long
+REPORT_RESULT_TTL = float(os.getenv('REPORT_RESULT_TTL') or 3600)
+# Stage results kept inside report jobs (see StageMemo)
+STAGE_MEMO_SIZE = int(os.getenv('STAGE_MEMO_SIZE') or 32)
+
+
+class JobQueueFull(RuntimeError):
+    """Raised by `JobService.submit` when the queue is at its depth limit."""
+
+
+class Job:
+    """A submitted computation; state is read from its future, so it also works for process pools."""
+
+    __slots__ = ('key', 'seq', 'future', 'submitted_at', 'finished_at')
+
+    def __init__(self, key, seq, future):
+        self.key, self.seq, self.future = key, seq, future
+        self.submitted_at, self.finished_at = time.time(), None
+
+    @property
+    def state(self):
+        if self.future.done():
+            return 'failed' if self.future.cancelled() or self.future.exception() else 'done'
+        return 'running' if self.future.running() else 'queued'
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class JobService:
+    """
+    Bounded worker pool shared by every session of the app.
+
+    Jobs are keyed; submitting a key that is queued, running or finished
+    within `result_ttl` returns the existing job, so a student refreshing the
+    page or opening several tabs costs one computation. Failed jobs are
+    dropped so the next submission retries. When `queue_limit` jobs are
+    already waiting, `submit` raises JobQueueFull instead of queueing more.
+    With `processes=True`, jobs run in spawned worker processes and must be
+    picklable top-level functions.
+    """
+
+    def __init__(self, workers=REPORT_WORKERS, queue_limit=REPORT_QUEUE_LIMIT, result_ttl=REPORT_RESULT_TTL,
+                 max_results=64, processes=False):
+        if processes:
+            self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self.pool = ThreadPoolExecutor(workers, thread_name_prefix='report')
+        self.processes = processes
+        self.queue_limit = queue_limit
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.jobs = {}
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'failed': 0}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _finished(self, job):
+        job.finished_at = time.time()
+        if job.state == 'failed':
+            with self._lock:
+                self.stats['failed'] += 1
+                if self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+
+    def _evict(self):
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        for i, job in enumerate(finished):
+            if now - job.finished_at > self.result_ttl or len(finished) - i > self.max_results:
+                del self.jobs[job.key]
+
+    def submit(self, key, fn, *args):
+        """Return `(job, created)`; `created` is False when an existing job for `key` was reused."""
+        with self._lock:
+            self._evict()
+            job = self.jobs.get(key)
+            if job is not None and job.state != 'failed':
+                self.stats['deduplicated'] += 1
+                return job, False
+            if self.queued() >= self.queue_limit:
+                self.stats['rejected'] += 1
+                raise JobQueueFull(f"{self.queue_limit} reports already waiting")
+            # Thread workers inherit the submitter's trace, so its debug panel shows the job's spans
+            future = self.pool.submit(fn if self.processes else propagate(fn), *args)
+            job = self.jobs[key] = Job(key, next(self._seq), future)
+            self.stats['submitted'] += 1
+        future.add_done_callback(lambda _: self._finished(job))
+        return job, True
+
+    def queued(self):
+        return sum(job.state == 'queued' for job in list(self.jobs.values()))
+
+    def position(self, job):
+        """Number of queued jobs submitted before `job`."""
+        return sum(other.state == 'queued' and other.seq < job.seq for other in list(self.jobs.values()))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class StageMemo:
+    """
+    The stages inside report jobs, memoized separately from the job results:
+    a student's parsed records (`ingest`, kept with the date range they
+    cover) and merged meals per range (`merge`). A report for another date
+    range then reuses the records instead of fetching and parsing them
+    again, and a calendar year equal to the report range reuses its meals.
+    Entries expire with finished reports and the least recently used are
+    dropped beyond `size`. Each worker process has its own memo.
+    """
+
+    def __init__(self, size=STAGE_MEMO_SIZE, ttl=REPORT_RESULT_TTL):
+        self.size, self.ttl = size, ttl
+        self.stats = {}
+        # (stage, key) -> (stored at, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, stage, key):
+        with self._lock:
+            entry = self._entries.get((stage, key))
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[stage, key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end((stage, key))
+            return None if entry is None else entry[1]
+
+    def put(self, stage, key, value):
+        with self._lock:
+            self._entries[stage, key] = (time.time(), value)
+            self._entries.move_to_end((stage, key))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def count(self, stage, hit):
+        with self._lock:
+            counts = self.stats.setdefault(stage, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+
+
+_memo = StageMemo()
+# Running metrics per student and report start date (see `_running_metrics`). They are checked
+# against the rows on every use, so they may outlive the report results, as the cached rows do
+_running = StageMemo(ttl=CACHE_TTL)
+
+
+def report_key(idserial, servicehall, *scope):
+    # The cookie is part of the key, so a job can only be joined by someone holding the same credentials
+    return (idserial, hashlib.sha256(servicehall.encode('utf-8')).hexdigest()[:16], *scope)
+
+
+def _fetch(idserial, servicehall, start, end, source=None, base_url=None):
+    if source is None:
+        if base_url is not None:
+            from utils.get_eat_record import get_record
+            source = get_record(servicehall, idserial, start, end, base_url=base_url)
+        else:
+            from utils.cache import get_cache
+            source = get_cache().get_record(servicehall, idserial, start, end)
+    return load_transactions(source)
+
+
+def _records_key(idserial, servicehall, source, base_url):
+    # Payloads and tables passed in directly are not memoized
+    if source is None:
+        return report_key(idserial, servicehall, base_url)
+    return ('source', os.path.abspath(os.fspath(source))) if isinstance(source, (str, os.PathLike)) else None
+
+
+def _stages(idserial, servicehall, start, end, source=None, base_url=None):
+    """
+    The range's transactions and its (raw, merged) meals from `process_data`,
+    through the stage memo, and whether each stage was a memo 'hit' or 'miss'.
+    """
+    key = _records_key(idserial, servicehall, source, base_url)
+    status = {}
+    with span('job.ingest'):
+        cached = _memo.get('ingest', key) if key is not None else None
+        status['ingest'] = 'hit' if cached is not None and cached[0] <= start and end <= cached[1] else 'miss'
+        if status['ingest'] == 'hit':
+            table = cached[2]
+        else:
+            # Keep the union with the range already held, so switching back is a hit as well
+            first, last = (min(start, cached[0]), max(end, cached[1])) if cached is not None else (start, end)
+            table = _fetch(idserial, servicehall, first, last, source, base_url)
+            if key is not None:
+                _memo.put('ingest', key, (first, last, table))
+        transactions = select_range(table, start, end)
+
+    merged = _memo.get('merge', (key, start, end)) if key is not None else None
+    status['merge'] = 'hit' if merged is not None else 'miss'
+    if merged is None:
+        merged = process_data(transactions)
+        if key is not None:
+            _memo.put('merge', (key, start, end), merged)
+    for stage, state in status.items():
+        _memo.count(stage, state == 'hit')
+    return transactions, merged, status
+
+
+def _running_metrics(key, start, rows):
+    """
+    An `IncrementalReport` over the range's raw meal rows and the stage status.
+    When the one kept for the student and start date was built from exactly
+    the rows up to its last transaction (same count and total), as on a daily
+    refresh that only adds transactions, only the newer rows are folded in.
+    """
+    txdate = rows['txdate']
+    cents = np.rint(rows['txamt'].to_numpy(dtype=float) * 100).astype(np.int64)
+    state = _running.get('metrics', (key, start)) if key is not None else None
+    if state is not None:
+        kept, through, count, total = state
+        seen = (txdate <= through).to_numpy()
+        if seen.sum() == count and cents[seen].sum() == total:
+            # Copied, so a concurrent job for another end date does not see these rows
+            report = copy.deepcopy(kept).update(rows[~seen])
+            status = 'hit'
+        else:
+            state = None
+    if state is None:
+        report, status = IncrementalReport().update(rows), 'miss'
+    if key is not None and len(rows):
+        _running.put('metrics', (key, start), (report, txdate.iloc[-1], len(rows), int(cents.sum())))
+    _memo.count('metrics', status == 'hit')
+    return report, status
+
+
+def compute_report(idserial, servicehall, start, end, source=None, base_url=None):
+    """
+    Fetch, parse, merge and compute every metric the report page shows.
+    `source` overrides the fetch with a payload, path or table; `base_url`
+    fetches from another card API endpoint without the record cache.
+    """
+    with span('job.report'):
+        transactions, (df_raw, df), stages = _stages(idserial, servicehall, start, end, source, base_url)
+        if df.empty:
+            raise ValueError("no meals in the selected date range")
+        running, stages['metrics'] = _running_metrics(_records_key(idserial, servicehall, source, base_url), start,
+                                                      df_raw)
+        earliest, latest = running.get_time_bounds()
+        (avg_cost, total_cost), most_expensive = running.get_costs(), running.get_max_cost()
+        shower_stats = get_shower_stats(transactions)
+        return {
+            'username': df['username'].iloc[0],
+            'costs': (avg_cost, total_cost),
+            'top_locations': running.get_top_locations(),
+            'top_counters': running.get_top_counters(),
+            'earliest': earliest,
+            'latest': latest,
+            'most_expensive': most_expensive,
+            'shower_stats': shower_stats,
+            'card_stats': get_card_stats(transactions),
+            'spending': merchant_spending(df_raw),
+            'cube': build_cube(df),
+            # Values ranked against the cohort store
+            'cohort': student_metrics(len(df), total_cost, avg_cost, earliest['txdate'], latest['txdate'],
+                                      most_expensive['txamt'], shower_stats['count']),
+            'stages': stages,
+        }
+
+
+def compute_year(idserial, servicehall, year, source=None, base_url=None):
+    """`build_report` for one calendar year, or None when it has no meals."""
+    with span('job.year', year=year):
+        transactions, merged, _ = _stages(idserial, servicehall, *year_range(year), source, base_url)
+        try:
+            return build_report(transactions, merged=merged)
+        except ValueError:
+            return None
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date
+from functools import partial
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import cache
+from utils.ask_gpt import stream_json
+from utils.get_eat_record import get_record
+from utils.jobs import JobQueueFull, JobService, compute_report, report_key
+from utils.prompts import get_eat_habbit_batch_prompt
+from utils.records import commentary_records
+from utils.stub_server import StubCardServer, StubLLMServer
+
+
+@contextmanager
+def _stub_cache(card_url):
+    """
+    Point the record cache at the stub card API, in a throwaway directory,
+    so reports take the deployed path through `get_cache()`. Spawned job
+    workers build their own cache from the same environment.
+    """
+    saved = {name: os.environ.get(name) for name in ('CACHE_DIR', 'CARD_BASE_URL')}
+    previous = cache._cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ.update(CACHE_DIR=cache_dir, CARD_BASE_URL=card_url)
+        cache._cache = cache.RecordCache(os.path.join(cache_dir, 'records.sqlite3'),
+                                         fetch=partial(get_record, base_url=card_url))
+        try:
+            yield cache._cache
+        finally:
+            cache._cache = previous
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+def _session(service, user, start, end, llm_url, poll):
+    """
+    One browser session: submit the report, poll it like the front end, then
+    stream the batched comments as the page does. Returns the seconds until
+    the first comment text arrived.
+    """
+    began = time.perf_counter()
+    idserial, servicehall = user
+    if service is None:
+        metrics = compute_report(idserial, servicehall, start, end)
+    else:
+        job, _ = service.submit(report_key(idserial, servicehall, start, end), compute_report,
+                                idserial, servicehall, start, end)
+        while not job.done():
+            time.sleep(poll)
+        metrics = job.result()
+    records = commentary_records(metrics)
+    first_card = None
+    prompt = get_eat_habbit_batch_prompt(metrics['username'], records)
+    # Uncached, so every session reaches the LLM as different students' prompts would
+    for _ in stream_json(prompt, list(records), 'stub', 'stub', llm_url, cache=False):
+        first_card = first_card or time.perf_counter() - began
+    return first_card
+
+
+def run_load(n_users, rows, start, end, workers=4, queue_limit=32, duplicates=0.2, processes=False, inline=False,
+             card_latency=0.05, llm_latency=0.5, poll=0.3, ramp=1.0):
+    """
+    Start `n_users` sessions over `ramp` seconds against stub card and LLM
+    servers and return per-session latencies (to the last comment, and to the
+    first comment text) and the number rejected.
+    Records are fetched through the record cache, as in the app. A `duplicates` fraction of sessions reuse an earlier student's
+    credentials, like refreshed pages or several tabs. With `inline`, each
+    session computes its report in its own thread, as before the job layer.
+    """
+    n_unique = max(1, round(n_users * (1 - duplicates)))
+    users = [(f"20250{i % n_unique:05d}", f"cookie-{i % n_unique}") for i in range(n_users)]
+    latencies, first_cards, rejected, failed = [], [], [], []
+    lock = threading.Lock()
+
+    with StubCardServer(rows, latency=card_latency) as card, StubLLMServer(latency=llm_latency) as llm, \
+            _stub_cache(card.base_url) as records:
+        service = None if inline else JobService(workers, queue_limit, processes=processes)
+
+        def user_thread(user):
+            began = time.perf_counter()
+            try:
+                first_card = _session(service, user, start, end, llm.base_url, poll)
+            except JobQueueFull:
+                with lock:
+                    rejected.append(user)
+                return
+            except Exception as e:
+                with lock:
+                    failed.append(repr(e))
+                return
+            with lock:
+                latencies.append(time.perf_counter() - began)
+                first_cards.append(first_card)
+
+        threads = []
+        began = time.perf_counter()
+        for i, user in enumerate(users):
+            time.sleep(max(0.0, began + ramp * i / n_users - time.perf_counter()))
+            thread = threading.Thread(target=user_thread, args=(user,))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        card_requests, llm_requests = card.requests, llm.requests
+        stats = dict(service.stats) if service else {}
+        if service:
+            service.shutdown()
+        # Hits and misses of worker processes are counted there, not here
+        cache_stats = dict(records.stats)
+
+    return {
+        'users': n_users,
+        'completed': len(latencies),
+        'rejected': len(rejected),
+        'failed': len(failed),
+        'errors': sorted(set(failed)),
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50': float(np.percentile(latencies, 50)) if latencies else None,
+        'p99': float(np.percentile(latencies, 99)) if latencies else None,
+        # Until the first comment text shows; the rest of the latency is the comments streaming in
+        'first_card_p50': float(np.percentile(first_cards, 50)) if first_cards else None,
+        'card_requests': card_requests,
+        'llm_requests': llm_requests,
+        'jobs': stats,
+        'cache': cache_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test report generation against stub card and LLM servers")
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 50], help="concurrent sessions per run")
+    parser.add_argument('--data', default='log.json', help="payload served by the stub card API")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queue-limit', type=int, default=32)
+    parser.add_argument('--duplicates', type=float, default=0.2, help="fraction of sessions repeating a student")
+    parser.add_argument('--processes', action='store_true', help="run jobs in worker processes instead of threads")
+    parser.add_argument('--inline', action='store_true', help="compute in each session thread, without the job layer")
+    parser.add_argument('--card-latency', type=float, default=0.05)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--ramp', type=float, default=1.0, help="seconds over which sessions start")
+    parser.add_argument('--json', action='store_true', help="print each run as a JSON line")
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding='utf-8') as f:
+        rows = json.load(f)['resultData']['rows']
+    years = sorted({row['txdate'][:4] for row in rows})
+    start, end = date(int(years[0]), 1, 1), date(int(years[-1]), 12, 31)
+
+    mode = 'inline' if args.inline else 'processes' if args.processes else 'threads'
+    if not args.json:
+        print(f"{mode}, {args.workers} workers, queue limit {args.queue_limit}, {args.duplicates:.0%} duplicates")
+        print(f"{'users':>6} {'done':>5} {'rejected':>9} {'failed':>7} {'p50':>8} {'p99':>8} {'1st card':>9} "
+              f"{'reports/s':>10} {'card reqs':>10}")
+    for n_users in args.users:
+        result = run_load(n_users, rows, start, end, args.workers, args.queue_limit, args.duplicates,
+                          args.processes, args.inline, args.card_latency, args.llm_latency, ramp=args.ramp)
+        if args.json:
+            print(json.dumps({'mode': mode, **result}, ensure_ascii=False))
+            continue
+        p50, p99, first = (f"{result[p]:.2f}s" if result[p] is not None else '-'
+                           for p in ('p50', 'p99', 'first_card_p50'))
+        print(f"{n_users:>6} {result['completed']:>5} {result['rejected']:>9} {result['failed']:>7} {p50:>8} "
+              f"{p99:>8} {first:>9} {result['throughput']:>10.2f} {result['card_requests']:>10}")
+        for error in result['errors']:
+            print(f"  error: {error}")
+
+
+if __name__ == "__main__":
+    main()
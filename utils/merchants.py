@@ -0,0 +1,116 @@
+import threading
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+CARD_COST_NAME = "学生卡成本"
+
+# Keywords to distinguish shower vs drinking-water merchants
+SHOWER_KEYWORDS = ("淋浴", "澡", "浴室", "洗澡")
+WATER_EXCLUDE_KEYWORDS = ("饮水", "直饮", "开水", "热水", "水房", "BOT")
+TOP_UP_KEYWORD = "充值"
+
+# Locations (meraddr) default to canteen and counters (mername) to counter
+MERCHANT_KINDS = ("canteen", "counter", "shower", "drinking-water", "card-cost", "top-up")
+
+
+def merchant_kind(name: str, column: str) -> str:
+    """Classify a merchant name seen in `column` ('meraddr' or 'mername'); earlier rules take precedence."""
+    if name == CARD_COST_NAME:
+        return "card-cost"
+    if column == "meraddr" and TOP_UP_KEYWORD in name:
+        return "top-up"
+    if any(k in name for k in WATER_EXCLUDE_KEYWORDS):
+        return "drinking-water"
+    if any(k in name for k in SHOWER_KEYWORDS):
+        return "shower"
+    return "canteen" if column == "meraddr" else "counter"
+
+
+def display_name(name: str) -> str:
+    """Name shown in the report: '紫荆园_冷荤冷饮' becomes '紫荆冷荤冷饮'."""
+    return name.replace("园_", "")
+
+
+class MerchantRegistry:
+    """
+    Interns every distinct (column, name) pair once and assigns it a stable
+    integer code for the lifetime of the process.
+
+    Kind and display name are computed at interning time, so classifying or
+    counting a column is an array lookup on its codes instead of a string
+    operation per row. Missing values map to code -1.
+
+    Codes are never reused, so the registry only grows; it holds one entry per
+    distinct merchant name the card system has shown this process. That set is
+    the campus's locations and counters (a few thousand names), not a function
+    of how many students or requests are served, so it is not evicted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes: t.Dict[t.Tuple[str, str], int] = {}
+        self.names: t.List[str] = []
+        self.columns: t.List[str] = []
+        self.display: t.List[str] = []
+        self._kind_list: t.List[int] = []
+        # Kind codes index into MERCHANT_KINDS; the trailing slot serves code -1.
+        # Rebuilt from _kind_list on the first lookup after new names are interned
+        self._kinds = np.full(1, -1, dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, name: str, column: str) -> int:
+        key = (column, name)
+        code = self._codes.get(key)
+        if code is not None:
+            return code
+        with self._lock:
+            code = self._codes.get(key)
+            if code is None:
+                code = len(self.names)
+                self.names.append(name)
+                self.columns.append(column)
+                self.display.append(display_name(name))
+                kind = MERCHANT_KINDS.index(merchant_kind(name, column))
+                self._kind_list.append(kind)
+                self._codes[key] = code
+        return code
+
+    def codes(self, values: pd.Series, column: t.Optional[str] = None) -> np.ndarray:
+        """Registry codes for a column of names, interning new ones; categoricals are looked up once per category."""
+        column = column or values.name
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype("category")
+        lookup = np.array([self.intern(str(c), column) for c in values.cat.categories] + [-1], dtype=np.int32)
+        return lookup[values.cat.codes.to_numpy()]
+
+    def kinds(self, codes: np.ndarray) -> np.ndarray:
+        """Kind code (index into MERCHANT_KINDS, or -1) of each registry code."""
+        kinds = self._kinds
+        if len(kinds) <= len(self._kind_list):
+            with self._lock:
+                kinds = self._kinds = np.array(self._kind_list + [-1], dtype=np.int8)
+        return kinds[codes]
+
+    def is_kind(self, codes: np.ndarray, *kinds: str) -> np.ndarray:
+        return np.isin(self.kinds(codes), [MERCHANT_KINDS.index(kind) for kind in kinds])
+
+    def count_distinct(self, groups: np.ndarray, codes: np.ndarray) -> pd.Series:
+        """Number of distinct groups each code occurs in, indexed by name and ordered by code."""
+        valid = codes >= 0
+        width = len(self.names)
+        pairs = pd.unique(groups[valid].astype(np.int64) * width + codes[valid])
+        counts = np.bincount(pairs % width if width else pairs, minlength=width)
+        present = np.flatnonzero(counts)
+        return pd.Series(counts[present], index=[self.names[code] for code in present])
+
+
+_registry = MerchantRegistry()
+
+
+def get_registry() -> MerchantRegistry:
+    """Return the process-wide registry, so codes agree across every table loaded in this process."""
+    return _registry
@@ -0,0 +1,57 @@
+import typing as t
+from datetime import date, timedelta
+
+import pandas as pd
+
+
+def year_range(year: int) -> t.Tuple[date, date]:
+    """Inclusive first and last day of a calendar year."""
+    return date(year, 1, 1), date(year, 12, 31)
+
+
+def range_label(start: date, end: date) -> str:
+    """'2025' for a calendar year, '2023–2025' for whole years, otherwise the two dates."""
+    if (start.month, start.day, end.month, end.day) == (1, 1, 12, 31):
+        return str(start.year) if start.year == end.year else f"{start.year}–{end.year}"
+    return f"{start:%Y-%m-%d} ~ {end:%Y-%m-%d}"
+
+
+def select_range(table: pd.DataFrame, start: t.Optional[date] = None,
+                 end: t.Optional[date] = None) -> pd.DataFrame:
+    """Rows of a transaction table whose `txdate` falls within the inclusive range; open ends are unbounded."""
+    mask = pd.Series(True, index=table.index)
+    if start is not None:
+        mask &= table['txdate'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= table['txdate'] < pd.Timestamp(end + timedelta(days=1))
+    return table if mask.all() else table[mask].reset_index(drop=True)
+
+
+def compare_years(reports: t.Dict[int, t.Optional[t.Dict[str, t.Any]]]) -> pd.DataFrame:
+    """
+    One row per year from per-year `build_report` results, with the change in
+    total spend against the previous listed year. Years without meals are
+    kept as empty rows so gaps stay visible.
+    """
+    rows = {}
+    for year in sorted(reports):
+        report = reports[year]
+        if not report:
+            rows[year] = {'meals': 0, 'total_cost': 0.0, 'showers': 0}
+            continue
+        rows[year] = {
+            'meals': report['meals'],
+            'total_cost': report['total_cost'],
+            'avg_cost': report['avg_cost'],
+            'top_location': next(iter(report['top_locations']), None),
+            'top_counter': next(iter(report['top_counters']), None),
+            'earliest': report['earliest']['time'][11:],
+            'latest': report['latest']['time'][11:],
+            'most_expensive': report['most_expensive']['amount'],
+            'showers': report['shower']['count'],
+        }
+    table = pd.DataFrame.from_dict(rows, orient='index')
+    table.index.name = 'year'
+    previous = table['total_cost'].shift()
+    table['total_change'] = (table['total_cost'] / previous.where(previous > 0) - 1).round(3)
+    return table
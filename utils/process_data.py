@@ -1,59 +1,88 @@
+import os
+import sys
 import pandas as pd
-import json
-
-def process_data(data):
-    if not isinstance(data, dict):
-        data = json.load(open(data, "r", encoding='utf-8'))
-    # Filter and transform data
-    all_data = [{
-        'txdate': pd.to_datetime(row['txdate']),
-        'txamt': round(row['txamt']*0.01, 2),
-        'meraddr': row['meraddr'],
-        'mername': row['mername'],
-        'username': row['username']
-    } for row in data['resultData']['rows'] 
-        if 'mername' in row and row.get('summary') in {'持卡人消费', '实体卡', 'nfc卡消费', '离线码在线消费'}]
-    # Convert to DataFrame and save raw data
-    df = pd.DataFrame(all_data)
-    
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.ingest import load_transactions
+from utils.periods import select_range
+from utils.tracing import span, traced
+
+# Records at the same meraddr within this window of a meal's first record are merged
+MERGE_WINDOW = pd.Timedelta(minutes=120)
+
+
+def merge_nearby(df, window=MERGE_WINDOW):
+    """
+    Merge transactions into meals on date-sorted columns.
+    A record joins the current meal if it has the same meraddr and falls within
+    `window` of the meal's first record; otherwise it starts a new meal.
+    """
+    n = len(df)
+    if n == 0:
+        # Keep the column dtypes so callers can still use the .dt accessor
+        return pd.DataFrame({
+            'txdate': df['txdate'].to_numpy(),
+            'txamt': np.zeros(0),
+            'meraddr': df['meraddr'].to_numpy(),
+            'mername': pd.Series([], dtype=object),
+            'username': df['username'].to_numpy(),
+        })
+
+    t = df['txdate'].to_numpy().astype('datetime64[us]').view('i8')
+    addr = df['meraddr'].to_numpy()
+    window = pd.Timedelta(window) // pd.Timedelta(microseconds=1)
+
+    # A new meal certainly starts where the address changes or the gap exceeds the window
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (addr[1:] != addr[:-1]) | (np.diff(t) > window)
+
+    # Runs longer than the window are split greedily from each meal's first record
+    seg_start = np.flatnonzero(starts)
+    seg_end = np.append(seg_start[1:], n)
+    long_runs = (t[seg_end - 1] - t[seg_start]) > window
+    for s, e in zip(seg_start[long_runs], seg_end[long_runs]):
+        i = s
+        while i < e:
+            i = s + np.searchsorted(t[s:e], t[i] + window, side='right')
+            if i < e:
+                starts[i] = True
+
+    first = np.flatnonzero(starts)
+    cents = np.rint(df['txamt'].to_numpy(dtype=float) * 100).astype(np.int64)
+    totals = np.add.reduceat(cents, first)
+
+    return pd.DataFrame({
+        'txdate': df['txdate'].iloc[first].to_numpy(),
+        'txamt': np.round(totals / 100, 2),
+        'meraddr': addr[first],
+        'mername': [list(x) for x in np.split(df['mername'].to_numpy(), first[1:])],
+        'username': df['username'].to_numpy()[first],
+    })
+
+
+@traced('process_data')
+def process_data(data, start=None, end=None):
+    # Parse once into a typed table and keep only meals within [start, end]
+    table = select_range(load_transactions(data), start, end)
+    meals = table[table['kind'] == 'meal'].reset_index(drop=True)
+    df = pd.DataFrame({
+        'txdate': meals['txdate'],
+        'txamt': np.round(meals['txamt'].to_numpy() / 100, 2),
+        'meraddr': meals['meraddr'].astype(object),
+        'mername': meals['mername'].astype(object),
+        'username': meals['username'],
+    })
+
     # Sort by date
     df = df.sort_values('txdate')
 
     # Merge nearby records
-    merged_records = []
-    current_group = None
-
-    for _, row in df.iterrows():
-        if current_group is None:
-            current_group = {
-                'txdate': row['txdate'],
-                'txamt': row['txamt'],
-                'meraddr': row['meraddr'],
-                'mername': [row['mername']],
-                'username': row['username']
-            }
-        else:
-            time_diff = (row['txdate'] - current_group['txdate']).total_seconds() / 60
-            
-            if time_diff <= 120 and row['meraddr'] == current_group['meraddr']:
-                current_group['txamt'] = round(current_group['txamt'] + row['txamt'], 2)
-                current_group['mername'].append(row['mername'])
-            else:
-                merged_records.append(current_group)
-                current_group = {
-                    'txdate': row['txdate'],
-                    'txamt': round(row['txamt'], 2),
-                    'meraddr': row['meraddr'],
-                    'mername': [row['mername']],
-                    'username': row['username']
-                }
-
-    if current_group is not None:
-        merged_records.append(current_group)
-    merged_df = pd.DataFrame(merged_records)
+    with span('merge', rows=len(df)):
+        merged_df = merge_nearby(df)
     merged_df['time_only'] = merged_df['txdate'].dt.time
-    
+
     return df, merged_df
 
 if __name__ == "__main__":
-    df, merged_df = process_data("consumption_data.json")
\ No newline at end of file
+    df, merged_df = process_data("consumption_data.json")
@@ -1,5 +1,7 @@
-def get_eat_habbit_prompt(name: str, record: str) -> str:
-    prompt = """你是一位以毒舌著称的学生就餐习惯评论家。你的评论风格尖锐幽默，擅长用戏谑的口吻点评学生的就餐习惯，但要保持在友善的界限内。
+import typing as t
+
+# 毒舌评论家人设与示例
+_PERSONA = """你是一位以毒舌著称的学生就餐习惯评论家。你的评论风格尖锐幽默，擅长用戏谑的口吻点评学生的就餐习惯，但要保持在友善的界限内。
 
 你的任务是查看学生的就餐记录，并以一种诙谐讽刺的方式评价他们的饮食习惯。要机智，要犀利，带点调侃，但不要过分刻薄。以下是一个示例：
 
@@ -9,24 +11,49 @@ def get_eat_habbit_prompt(name: str, record: str) -> str:
 
 高消费版本："哇哦，单次消费¥169.86！这是把整个食堂的菜单都打包了吗？还是为了整个实验室接风洗尘？建议申请一个'校园美食探店博主'的认证，这样至少还能混个知名度～"
 
-在评论中要善用清华特色梗，并巧妙运用回扣技巧，将前后文串联。
+在评论中要善用清华特色梗，并巧妙运用回扣技巧，将前后文串联。"""
+
+_RULES = """1. 用中文输出
+2. 语气要调侃但不失温度
+3. 适当引用清华校园文化
+4. 针对特殊的就餐时间或金额做出机智点评
+5. 简短的 3 句话以内"""
+
+
+def get_eat_habbit_batch_prompt(name: str, records: t.Dict[str, t.Tuple[str, str]]) -> str:
+    """
+    One prompt for several highlight cards: `records` maps an id to (card
+    title, record text), and the reply is a JSON object of id -> comment.
+    The persona and examples are sent once instead of once per card.
+    """
+    items = "\n".join(f'<record id="{key}" title="{title}">\n{record}\n</record>'
+                      for key, (title, record) in records.items())
+    example = ", ".join(f'"{key}": "……"' for key in records)
+    return _PERSONA + f"""
 
 输入：
 <student_info>
-{student_name}
+{name}
 </student_info>
 
-<dining_record>
-{dining_record}
-</dining_record>
+<dining_records>
+{items}
+</dining_records>
+
+请为每条记录各写一条评论，评论之间可以互相呼应。每条评论的要求：
+{_RULES}
+
+只输出一个 JSON 对象，键为记录的 id，值为对应的评论，例如：
+{{{example}}}
+不要输出任何其他内容"""
 
-输出要求：
-1. 用中文输出
-2. 语气要调侃但不失温度
-3. 适当引用清华校园文化
-4. 针对特殊的就餐时间或金额做出机智点评
-5. 简短的 3 句话以内
 
-请直接输出评论，不要输出任何其他内容"""
+def get_json_repair_prompt(text: str, keys: t.Iterable[str]) -> str:
+    """Ask the model to turn a malformed reply back into the expected JSON object."""
+    keys = ", ".join(f'"{key}"' for key in keys)
+    return f"""下面这段文本本应是一个 JSON 对象，键为 {keys}，值均为字符串，但格式有误或缺少键。
+请修正为合法的 JSON 对象并只输出该 JSON，不要改写评论内容；缺少的键请根据上下文补写一条简短评论。
 
-    return prompt.format(student_name=name, dining_record=record)
\ No newline at end of file
+<text>
+{text}
+</text>"""
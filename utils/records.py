@@ -0,0 +1,78 @@
+import os
+import re
+import sys
+import typing as t
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analyze_data import get_meal_types
+from utils.merchants import display_name
+
+# Rough tokenizer costs used by `estimate_tokens`: CJK characters usually take
+# about one token each, other text about four characters per token
+CJK_TOKENS_PER_CHAR = 1.0
+CHARS_PER_TOKEN = 4.0
+_CJK = re.compile(r'[⺀-鿿가-힯豈-﫿＀-￯　-〿]')
+
+# Titles of the cards that get a comment; the page shows the same titles
+HIGHLIGHT_TITLES = {'earliest': "清晨觅食冠军", 'latest': "夜宵王者", 'most_expensive': "土豪餐王"}
+SHOWER_TITLE = "洗澡大王"
+
+
+def _counters(place: str, names: t.Iterable[str]) -> str:
+    # Swipe order with repeats folded, and the canteen prefix dropped since the place is given
+    counts = {}
+    for name in names:
+        name = str(name)
+        name = name[len(place) + 1:] if name.startswith(f"{place}_") else display_name(name)
+        counts[name] = counts.get(name, 0) + 1
+    return "、".join(name if count == 1 else f"{name}×{count}" for name, count in counts.items())
+
+
+def format_meal(record: t.Mapping[str, t.Any], meal_type: bool = True,
+                rank: t.Optional[t.Tuple[str, int, int]] = None) -> str:
+    """
+    One merged meal (a row of `process_data`'s merged frame) as a single
+    line for prompts: time to the minute, place, counters and amount, plus
+    the meal type and `rank` as (criterion, position, out of) when given,
+    e.g. ("最贵", 3, 452) for the third most expensive meal. Depends only
+    on the values, never on pandas display settings, so equal meals always
+    give equal text.
+    """
+    when = pd.Timestamp(record['txdate'])
+    place = str(record['meraddr'])
+    names = record['mername']
+    names = [names] if isinstance(names, str) else list(names)
+    fields = [f"时间 {when:%Y-%m-%d %H:%M}", f"地点 {place}", f"窗口 {_counters(place, names)}",
+              f"金额 ¥{float(record['txamt']):.2f}"]
+    if meal_type:
+        fields.append(f"餐次 {get_meal_types(pd.Series([when]))[0]}")
+    if rank is not None:
+        criterion, position, total = rank
+        fields.append(f"{criterion}排名 {total} 顿中第 {position}")
+    return "｜".join(fields)
+
+
+def commentary_records(metrics: t.Mapping[str, t.Any]) -> t.Dict[str, t.Tuple[str, str]]:
+    """
+    The cards of a `compute_report` result that get a comment, as id ->
+    (title, record text) for `get_eat_habbit_batch_prompt`: the three
+    highlight meals, plus the shower summary when there were showers.
+    """
+    records = {key: (title, format_meal(metrics[key])) for key, title in HIGHLIGHT_TITLES.items()}
+    shower_stats = metrics['shower_stats']
+    if shower_stats.get("count", 0):
+        records['shower'] = (SHOWER_TITLE, "共计洗澡 {count} 次，总金额 ¥{amount:.2f}，平均每次 ¥{avg_amount:.2f}"
+                             .format(**shower_stats))
+    return records
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate prompt tokens without a tokenizer: CJK characters at
+    `CJK_TOKENS_PER_CHAR` each, everything else at `CHARS_PER_TOKEN` per token.
+    Good for budgeting and comparing prompts, not for exact billing.
+    """
+    cjk = len(_CJK.findall(text))
+    return round(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) / CHARS_PER_TOKEN)
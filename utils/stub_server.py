@@ -0,0 +1,216 @@
+import re
+import json
+import bisect
+import time
+import base64
+import secrets
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+
+def encrypt_aes_ecb(plain: str) -> str:
+    """Inverse of `decrypt_aes_ecb`: a random 16-char key followed by the base64 ciphertext."""
+    key = secrets.token_hex(8)
+    cipher = AES.new(key.encode('utf-8'), AES.MODE_ECB)
+    return key + base64.b64encode(cipher.encrypt(pad(plain.encode('utf-8'), AES.block_size))).decode('ascii')
+
+
+class StubCardServer:
+    """
+    Local stand-in for card.tsinghua.edu.cn serving querySelfTradeList pages
+    in the same encrypted format, filtered by date range and paginated.
+    Use as a context manager; `base_url` points at the running server.
+    """
+
+    def __init__(self, rows, latency=0.0, port=0):
+        # The real API returns rows newest first
+        self.rows = sorted(rows, key=lambda row: row['txdate'], reverse=True)
+        self._dates = [row['txdate'][:10] for row in reversed(self.rows)]
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def page(self, start, end, page_number, page_size):
+        n = len(self.rows)
+        rows = self.rows[n - bisect.bisect_right(self._dates, end):n - bisect.bisect_left(self._dates, start)]
+        total_pages = max(1, -(-len(rows) // page_size))
+        return {
+            "message": "成功",
+            "resultData": {
+                "totalpage": total_pages,
+                "total": len(rows),
+                "size": page_size,
+                "currentPage": page_number,
+                "rows": rows[page_number * page_size:(page_number + 1) * page_size],
+            },
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+                payload = stub.page(query['starttime'], query['endtime'],
+                                    int(query['pageNumber']), int(query['pageSize']))
+                body = json.dumps({"data": encrypt_aes_ecb(json.dumps(payload, ensure_ascii=False))}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubLLMServer:
+    """
+    Local OpenAI-compatible endpoint answering /chat/completions after `latency`
+    seconds with a canned reply; JSON-mode requests get a JSON object with that
+    reply for every `<record id="...">` in the prompt. Streamed requests get one
+    character per server-sent event, `token_latency` seconds apart; blocking
+    requests wait for the whole reply to be generated. Use as a context manager;
+    `base_url` is the value to pass as the client's base URL.
+    """
+
+    def __init__(self, latency=0.0, reply="这是一条测试评论。", token_latency=0.0, port=0):
+        self.latency = latency
+        self.reply = reply
+        self.token_latency = token_latency
+        self.requests = 0
+        self.prompts = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reply_for(self, request):
+        if (request.get("response_format") or {}).get("type") != "json_object":
+            return self.reply
+        keys = re.findall(r'<record id="([^"]+)"', request["messages"][-1]["content"])
+        return json.dumps({key: self.reply for key in keys}, ensure_ascii=False)
+
+    def completion(self, request):
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply_for(request)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def chunks(self, request):
+        for token in list(self.reply_for(request)) + [None]:
+            yield {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": token} if token is not None else {},
+                    "finish_reason": None if token is not None else "stop",
+                }],
+            }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.prompts.append(request["messages"][-1]["content"])
+                time.sleep(stub.latency)
+                if request.get("stream"):
+                    return self._stream(request)
+                time.sleep(stub.token_latency * len(stub.reply_for(request)))
+                body = json.dumps(stub.completion(request), ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, request):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                for i, chunk in enumerate(stub.chunks(request)):
+                    if i:
+                        time.sleep(stub.token_latency)
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a payload file as an encrypted querySelfTradeList stub")
+    parser.add_argument('--data', default='log.json')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds of delay per request")
+    args = parser.parse_args()
+
+    rows = json.load(open(args.data, "r", encoding='utf-8'))['resultData']['rows']
+    with StubCardServer(rows, latency=args.latency, port=args.port) as server:
+        print(f"Serving {len(rows)} rows at {server.base_url}")
+        threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import json
+import random
+import argparse
+import typing as t
+from datetime import date, datetime, timedelta
+
+# Canteens and their counters, with visit weights roughly as in log.json
+CANTEENS = {
+    '紫荆园': (30, ['紫荆园_冷荤冷饮', '紫荆园_淮扬风味', '紫荆园_三层大伙', '紫荆园_二层大伙', '紫荆园_港记烧腊',
+                   '紫荆园_西饼糕点', '紫荆园_包子饺子', '紫荆园_上海小吃', '紫荆园_四层大伙', '紫荆园_广式风味']),
+    '清芬园': (26, ['清芬园_二层大伙', '清芬园_二层低档菜', '清芬园_川渝小吃', '清芬园_二层冷饮', '清芬园_二层主食',
+                   '清芬园_东南风味', '清芬园_一层冷饮']),
+    '桃李园': (25, ['桃李园_二层大伙', '桃李园_福州组', '桃李园_烤烙组', '桃李园_冷饮组', '桃李园_雷椒拌饭',
+                   '桃李园_煎饼组', '桃李园_湘菜组', '桃李园_米粉米线组', '桃李园_糕点组']),
+    '听涛园': (4, ['听涛园_清青牛拉', '听涛园_大菜组']),
+    '丁香园': (3, ['丁香园_大菜2组', '丁香园_5号广东风味', '丁香园_4号烤肉拌饭']),
+    '观畴园': (3, ['观畴园_点菜组', '观畴园_清青永和']),
+    '玉树园': (1, ['玉树园_风味组']),
+    '清青快餐': (1, ['清青快餐_西餐组']),
+}
+DORMS = ['南区26号东楼', '南区26号西楼', '南区23号东楼']
+MEAL_SUMMARIES = ['持卡人消费', '持卡人消费', '持卡人消费', '实体卡', 'nfc卡消费', '离线码在线消费']
+# (first hour, last hour, probability of eating) per meal of the day
+MEAL_TIMES = [(6, 9, 0.45), (11, 13, 0.9), (17, 19, 0.85), (21, 23, 0.12)]
+
+
+class _Student:
+    """Running card state, so balances and journal numbers stay consistent."""
+
+    def __init__(self, rng, username, idserial):
+        self.rng = rng
+        self.base = {
+            'idserial': idserial, 'inputuserid': 0, 'pcode': '02', 'accno': str(rng.randrange(10**9, 10**10)),
+            'cardno': str(rng.randrange(10**6, 10**7)), 'sts': 1, 'departid': 0, 'username': username,
+            'identityno': ''.join(rng.choice('0123456789ABCDEF') for _ in range(48)),
+        }
+        self.balance = rng.randrange(5000, 30000)
+        self.journo = rng.randrange(10**7, 10**8)
+        self.canteens = list(CANTEENS)
+        self.weights = [CANTEENS[name][0] for name in self.canteens]
+        self.dorm = rng.choice(DORMS)
+
+    def row(self, when, amount, summary, meraddr, mername=None, txname='持卡人消费', txcode='1210'):
+        self.journo += self.rng.randrange(1, 500)
+        self.balance += amount if txcode != '1210' else -amount
+        row = {
+            'summary': summary, 'posjourno': f"{self.rng.randrange(10**5, 10**6)}_{self.journo}{self.rng.randrange(10**9)}",
+            **self.base, 'txaccno': str(self.rng.randrange(10**8, 10**9)),
+            'poscode': str(self.rng.randrange(1000, 999999)), 'txcode': txcode,
+            'txdate': when.strftime('%Y-%m-%d %H:%M:%S'), 'txname': txname, 'stationcode': '0001',
+            'balance': self.balance, 'journo': self.journo,
+            # Midnight Beijing time in epoch milliseconds, as the API reports it
+            'regdate': (when.date() - date(1970, 1, 1)).days * 86_400_000 - 8 * 3_600_000,
+            'id': str(self.rng.randrange(10**18, 10**19)), 'txamt': amount, 'meraddr': meraddr,
+        }
+        if mername is not None:
+            row['mername'] = mername
+        return row
+
+    def day(self, today: date) -> t.List[t.Dict[str, t.Any]]:
+        rng, rows = self.rng, []
+        for first, last, p in MEAL_TIMES:
+            if rng.random() >= p:
+                continue
+            canteen = rng.choices(self.canteens, self.weights)[0]
+            counters = CANTEENS[canteen][1]
+            when = datetime(today.year, today.month, today.day, rng.randint(first, last), rng.randrange(60),
+                            rng.randrange(60))
+            # A meal is one to three swipes at the same canteen within a few minutes
+            for _ in range(rng.choices([1, 2, 3], [70, 24, 6])[0]):
+                counter = counters[min(int(rng.expovariate(0.6)), len(counters) - 1)]
+                rows.append(self.row(when, rng.randrange(150, 3000, 10), rng.choice(MEAL_SUMMARIES), canteen, counter))
+                when += timedelta(seconds=rng.randrange(20, 600))
+        if rng.random() < 0.55:
+            when = datetime(today.year, today.month, today.day, rng.randint(19, 23), rng.randrange(60), rng.randrange(60))
+            rows.append(self.row(when, rng.randrange(40, 250), '水控POS消费流水', self.dorm, f"{self.dorm}_淋浴"))
+        for _ in range(rng.choices([0, 1, 2], [60, 30, 10])[0]):
+            when = datetime(today.year, today.month, today.day, rng.randint(7, 23), rng.randrange(60), rng.randrange(60))
+            mername = rng.choice([f"{self.dorm}_饮水_自营", '南区26号楼_饮水_好景BOT'])
+            rows.append(self.row(when, rng.randrange(1, 20), '水控POS消费流水', self.dorm if '自营' in mername else '-',
+                                 mername))
+        if rng.random() < 1 / 400:
+            when = datetime(today.year, today.month, today.day, rng.randint(9, 17), rng.randrange(60), rng.randrange(60))
+            rows.append(self.row(when, 2000, '自助补卡账户余额扣费', '学生卡成本', '学生卡成本'))
+        if self.balance < 5000:
+            when = datetime(today.year, today.month, today.day, rng.randint(8, 22), rng.randrange(60), rng.randrange(60))
+            if rng.random() < 0.8:
+                rows.append(self.row(when, rng.choice([20000, 40000]), '中行圈存', '在线充值', txname='中行圈存',
+                                     txcode='1161'))
+            else:
+                serial = f"10003{when:%Y%m%d%H%M%S}{rng.randrange(10**5):05d}"
+                rows.append(self.row(when, rng.choice([20000, 40000]), f"移动端交易({serial})", '在线充值',
+                                     txname='微信充值', txcode='1824'))
+        rows.sort(key=lambda row: row['txdate'])
+        return rows
+
+
+def generate_rows(n_rows: int, start: date = date(2025, 1, 1), seed: int = 0,
+                  username: str = '测试同学', idserial: str = '2025000000') -> t.List[t.Dict[str, t.Any]]:
+    """
+    Generate `n_rows` querySelfTradeList rows, newest first as the API returns
+    them, day by day from `start` for as many days as needed (four to five
+    rows per day). Meals cluster at canteens with one to three swipes each,
+    with showers and drinking water at the student's dorm, top-ups whenever
+    the balance runs low and the occasional card reissue. Deterministic for
+    a given seed.
+    """
+    student = _Student(random.Random(seed), username, idserial)
+    rows, today = [], start
+    while len(rows) < n_rows:
+        rows.extend(student.day(today))
+        today += timedelta(days=1)
+    return rows[:n_rows][::-1]
+
+
+def generate_payload(n_rows: int, start: date = date(2025, 1, 1), seed: int = 0, **student) -> t.Dict[str, t.Any]:
+    """`generate_rows` wrapped in the decrypted querySelfTradeList envelope."""
+    rows = generate_rows(n_rows, start, seed, **student)
+    return {
+        "message": "成功",
+        "resultData": {"totalpage": 1, "total": len(rows), "size": len(rows), "currentPage": 0, "rows": rows},
+        "success": True,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic querySelfTradeList payload")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--out', default='synthetic.json')
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2025, 1, 1))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(generate_payload(args.rows, args.start, args.seed), f, ensure_ascii=False, indent=4)
+    print(f"{args.rows} rows -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
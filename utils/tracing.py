@@ -0,0 +1,175 @@
+import json
+import time
+import threading
+import functools
+import tracemalloc
+import typing as t
+from contextvars import ContextVar
+
+# (trace, parent span) of the running code; spans outside a trace cost one lookup
+_current: ContextVar = ContextVar('trace', default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed region of a `Trace`; use through `span()`."""
+
+    __slots__ = ('trace', 'parent', 'name', 'attrs', 'depth', 'start', 'duration', 'peak', '_token')
+
+    def __init__(self, trace, parent, name, attrs):
+        self.trace, self.parent, self.name, self.attrs = trace, parent, name, attrs
+        self.depth = parent.depth + 1 if parent else 0
+        self.start = self.duration = None
+        self.peak = 0
+
+    def set(self, **attrs):
+        """Attach attributes known only inside the span, such as row counts."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        if self.trace.memory:
+            self.trace._fold_peak(self.parent)
+        self._token = _current.set((self.trace, self))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        if self.trace.memory:
+            self.trace._fold_peak(self)
+            if self.parent:
+                self.parent.peak = max(self.parent.peak, self.peak)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.trace._finish(self)
+        return False
+
+
+class Trace:
+    """
+    Collects the spans opened while it is active.
+    With `memory=True`, tracemalloc runs for the duration of the trace and
+    each span records the peak traced memory reached inside it. The peak is
+    process-wide, so spans running concurrently on other threads count
+    towards it, and tracemalloc slows the traced code down noticeably;
+    timing-only traces are the default.
+    """
+
+    def __init__(self, name='trace', memory=False):
+        self.name = name
+        self.memory = memory
+        self.spans: t.List[Span] = []
+        self.origin = None
+        self._lock = threading.Lock()
+
+    def _fold_peak(self, span):
+        # Credit the peak since the last reset to the innermost open span, then restart it
+        if span is not None:
+            span.peak = max(span.peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    def _finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def __enter__(self):
+        self._owns_tracemalloc = self.memory and not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+        elif self.memory:
+            tracemalloc.reset_peak()
+        self.origin = time.perf_counter()
+        self._token = _current.set((self, None))
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        self.elapsed = time.perf_counter() - self.origin
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+    def records(self) -> t.List[t.Dict[str, t.Any]]:
+        """Finished spans in start order, as plain dicts with times in milliseconds."""
+        records = []
+        for span in sorted(self.spans, key=lambda span: span.start):
+            record = {
+                'name': span.name,
+                'depth': span.depth,
+                'start_ms': round((span.start - self.origin) * 1e3, 3),
+                'duration_ms': round(span.duration * 1e3, 3),
+                **span.attrs,
+            }
+            if self.memory:
+                record['peak_mb'] = round(span.peak / 2**20, 2)
+            records.append(record)
+        return records
+
+    def totals(self) -> t.Dict[str, float]:
+        """Total milliseconds per span name, slowest first."""
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration * 1e3
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def to_json(self, **fields) -> str:
+        return json.dumps({'trace': self.name, 'elapsed_ms': round(self.elapsed * 1e3, 3),
+                           **fields, 'spans': self.records()}, ensure_ascii=False)
+
+
+def span(name: str, **attrs):
+    """Time a block as a child of the current span; a no-op unless a `Trace` is active."""
+    current = _current.get()
+    if current is None:
+        return _NOOP
+    return Span(current[0], current[1], name, attrs)
+
+
+def traced(name: t.Optional[str] = None):
+    """Decorator form of `span`, named after the function by default."""
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def propagate(fn):
+    """
+    Bind `fn` to the caller's trace and span, so spans it opens on a pool
+    thread nest under the span that submitted it.
+    """
+    current = _current.get()
+    if current is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _current.set(current)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper